@@ -1,21 +1,53 @@
 import subprocess
 from flask_json_schema import JsonSchema, JsonValidationError
-from flask import Flask, request, jsonify
+from jsonschema.validators import validator_for
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, g
 from flask_apscheduler import APScheduler
-from datetime import datetime
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
+from datetime import datetime, timezone
 
 import time
 import os
+import logging
 from dotenv import load_dotenv, find_dotenv
 
-import pycurl
-from io import BytesIO
 import json
 import uuid
-
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
-from pymongo.errors import ConnectionFailure
+import atexit
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import base64
+import zlib
+import socket
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from log_config import setup_logging
+# Antes de importar db, que se conecta a Mongo al importarse
+setup_logging()
+
+from db import plant_collection, device_collection, garden_collection, plant_data_collection, plant_data_store, rollup_store, node_collection, device_lease_collection, collection_versions, cold_archive, plant_data_reader
+from ingest_buffer import IngestBuffer
+from device_client import DeviceClient
+from device_registry import DeviceRegistry
+from poller import DevicePoller
+from readings import MAX_TIMESTAMP, parse_timestamp, sensor_data_document, valid_timestamp
+from rollups import ROLLUP_INTERVALS
+from job_stats import JobLagTracker
+from scheduler_lock import SchedulerLock
+from cluster import NodeCluster
+from listing_cache import ListingCache
+from latest_readings import LatestReadings
+from compression import ResponseCompressor
+from plant_export import EXPORT_FORMATS, EXPORT_PROFILES, export_chunks, export_documents
+import metrics
+
+logger = logging.getLogger('app')
 
 class APScheduler_Config:
     SCHEDULER_API_ENABLED = True
@@ -23,43 +55,125 @@ class APScheduler_Config:
 
 load_dotenv(find_dotenv())
 
-MONGO_DB_LOCAL_USER = os.environ.get("MONGO_DB_LOCAL_USER")
-MONGO_DB_LOCAL_PWD = os.environ.get("MONGO_DB_LOCAL_PWD")
-MONGO_DB_LOCAL_IP = os.environ.get("MONGO_DB_LOCAL_IP")
-MONGO_DB_LOCAL_PORT = os.environ.get("MONGO_DB_LOCAL_PORT")
-
-# URI for the cluster. Remember to have an .env file with user, password and DB name for the local Mongo DB instance
-uri = f"mongodb://{MONGO_DB_LOCAL_USER}:{MONGO_DB_LOCAL_PWD}@{MONGO_DB_LOCAL_IP}:{MONGO_DB_LOCAL_PORT}"
-
-app = Flask(__name__)
-schema = JsonSchema(app)
+# Optional write-behind queue for single reading POSTs on /plant_data
+INGEST_BUFFER_ENABLED = os.environ.get("INGEST_BUFFER_ENABLED", "0") == "1"
+INGEST_BUFFER_MAX_BATCH = int(os.environ.get("INGEST_BUFFER_MAX_BATCH", 500))
+INGEST_BUFFER_FLUSH_MS = int(os.environ.get("INGEST_BUFFER_FLUSH_MS", 250))
+INGEST_BUFFER_MAX_QUEUE = int(os.environ.get("INGEST_BUFFER_MAX_QUEUE", 10000))
+
+# Device HTTP calls: connect and total timeouts, and how long ping results are reused
+DEVICE_CONNECT_TIMEOUT_MS = int(os.environ.get("DEVICE_CONNECT_TIMEOUT_MS", 2000))
+DEVICE_TOTAL_TIMEOUT_MS = int(os.environ.get("DEVICE_TOTAL_TIMEOUT_MS", 5000))
+DEVICE_PING_CACHE_SECONDS = int(os.environ.get("DEVICE_PING_CACHE_SECONDS", 30))
+
+# Parallel device pings when scheduling jobs at startup
+STARTUP_PING_WORKERS = int(os.environ.get("STARTUP_PING_WORKERS", 16))
+
+# How often the in-memory device registry is reloaded from Mongo
+DEVICE_REGISTRY_REFRESH_SECONDS = int(os.environ.get("DEVICE_REGISTRY_REFRESH_SECONDS", 60))
+
+# Cached /plant, /device and /garden listings: how often collection versions are re-read from Mongo
+# (writes from other workers/nodes) and the max age of a cached body (writes outside the API)
+LISTING_CACHE_RECHECK_SECONDS = int(os.environ.get("LISTING_CACHE_RECHECK_SECONDS", 5))
+LISTING_CACHE_MAX_AGE_SECONDS = int(os.environ.get("LISTING_CACHE_MAX_AGE_SECONDS", 60))
+
+# Latest readings are kept in memory; with several workers a plant catches up on readings written
+# by other processes at most this often (0 disables the catch-up, single process only)
+LATEST_READINGS_REFRESH_SECONDS = int(os.environ.get("LATEST_READINGS_REFRESH_SECONDS", 5))
+
+# Response compression negotiated from Accept-Encoding: gzip, plus zstd/br when the zstandard/brotli
+# packages are installed. Smaller non-streamed responses are sent as is
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))
+
+# Device polling engine: concurrent requests allowed per device and in total
+DEVICE_POLL_MAX_PER_DEVICE = int(os.environ.get("DEVICE_POLL_MAX_PER_DEVICE", 1))
+DEVICE_POLL_MAX_IN_FLIGHT = int(os.environ.get("DEVICE_POLL_MAX_IN_FLIGHT", 64))
+# How long a poll waits for other plants on the same device to join its request
+DEVICE_POLL_COALESCE_MS = int(os.environ.get("DEVICE_POLL_COALESCE_MS", 50))
+
+# Random delay (0 to N seconds) added to every poll job run, on top of the fixed per-device offset
+SCHEDULER_JOB_JITTER_SECONDS = int(os.environ.get("SCHEDULER_JOB_JITTER_SECONDS", 0))
+
+# Only the process holding this lock file runs the scheduler and the device poller (see create_app)
+SCHEDULER_LOCK_FILE = os.environ.get("SCHEDULER_LOCK_FILE", os.path.join(tempfile.gettempdir(), "cultivapp_scheduler.lock"))
+# How often the other processes try to take over the scheduler lock
+SCHEDULER_LOCK_RETRY_SECONDS = int(os.environ.get("SCHEDULER_LOCK_RETRY_SECONDS", 15))
+# How often the scheduler owner reloads poll jobs from plant_collection
+SCHEDULER_SYNC_SECONDS = int(os.environ.get("SCHEDULER_SYNC_SECONDS", 30))
+
+# Backend nodes sharing one Mongo split the devices among them. NODE_ID must be unique per node
+NODE_ID = os.environ.get("NODE_ID", socket.gethostname())
+# A node that misses heartbeats for this long loses its devices to the other nodes (renewed on every sync)
+NODE_LEASE_SECONDS = int(os.environ.get("NODE_LEASE_SECONDS", 90))
+
+api = Blueprint('api', __name__)
+schema = JsonSchema()
 
 scheduler = APScheduler()
-
-
-# # Attempt to connect to local Mongo database
-print(f'[LOG] Attempting to connect to MongoDB on {uri}')
-try:
-    client = MongoClient(uri,
-                         server_api=ServerApi('1'),
-                         serverSelectionTimeoutMS=5000,
-                         connectTimeoutMS=5000,
-                         socketTimeoutMS=5000, 
-                         uuidRepresentation='standard'
-                         )
-    client.admin.command('ping')
-except ConnectionFailure as e:
-    print(f"[ERROR] Could not connect to mongoDB database {e}")
-
-# Define database or create database if not exists
-
-plant_db = client["ver_2bd"]
-
-# Define collection or create collection if not exists
-plant_collection = plant_db["plants"]
-device_collection = plant_db["devices"]
-garden_collection = plant_db["gardens"]
-plant_data_collection = plant_db["plant_data"]
+scheduler_lock = SchedulerLock(SCHEDULER_LOCK_FILE)
+job_lag_tracker = JobLagTracker()
+node_cluster = NodeCluster(node_collection, device_lease_collection, NODE_ID, lease_seconds=NODE_LEASE_SECONDS)
+# Job interno que sincroniza los jobs de polling con la base de datos
+SYNC_JOB_ID = 'sync_poll_jobs'
+# Intentos para generar un plant_id que no exista (8 digitos hex de un uuid4)
+PLANT_ID_ATTEMPTS = 5
+# Plantas con polling; las que no tienen el campo se consultan, como antes
+POLLING_PLANTS_QUERY = {'update_poll_activated': {'$ne': False}}
+
+
+# Default and maximum page size for plant data history queries
+PLANT_DATA_DEFAULT_LIMIT = 1000
+PLANT_DATA_MAX_LIMIT = 10000
+# Documents per Mongo batch / NDJSON chunk when streaming plant data
+PLANT_DATA_STREAM_BATCH_SIZE = 500
+# Max limit accepted when streaming (without limit the whole range is streamed)
+PLANT_DATA_STREAM_MAX_LIMIT = 1000000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Max readings accepted by POST /plant_data/batch
+PLANT_DATA_BATCH_MAX_SIZE = 5000
+# Rows per CSV chunk / Parquet row group / Arrow record batch in /plant_data/export
+PLANT_DATA_EXPORT_BATCH_SIZE = int(os.environ.get("PLANT_DATA_EXPORT_BATCH_SIZE", 10000))
+
+# Readings older than this many days are moved from Mongo to ARCHIVE_DIR (0 disables the archiver).
+# Runs every ARCHIVE_INTERVAL_SECONDS in the process that owns the scheduler. The timeseries layout needs MongoDB 7.0
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 0))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get("ARCHIVE_INTERVAL_SECONDS", 3600))
+ARCHIVE_JOB_ID = 'archive_plant_data'
+# Jobs del scheduler que no son de polling; sync_poll_jobs no los toca
+INTERNAL_JOB_IDS = {SYNC_JOB_ID, ARCHIVE_JOB_ID}
+
+device_registry = DeviceRegistry(device_collection, refresh_seconds=DEVICE_REGISTRY_REFRESH_SECONDS)
+
+listing_cache = ListingCache(collection_versions,
+                             recheck_seconds=LISTING_CACHE_RECHECK_SECONDS,
+                             max_age_seconds=LISTING_CACHE_MAX_AGE_SECONDS)
+
+response_compressor = ResponseCompressor(min_bytes=COMPRESSION_MIN_BYTES)
+
+latest_readings = LatestReadings(plant_data_store, refresh_seconds=LATEST_READINGS_REFRESH_SECONDS)
+plant_data_store.add_listener(latest_readings.record)
+
+device_client = DeviceClient(connect_timeout_ms=DEVICE_CONNECT_TIMEOUT_MS,
+                             total_timeout_ms=DEVICE_TOTAL_TIMEOUT_MS,
+                             ping_cache_seconds=DEVICE_PING_CACHE_SECONDS)
+
+device_poller = DevicePoller(device_client,
+                             max_per_device=DEVICE_POLL_MAX_PER_DEVICE,
+                             max_total=DEVICE_POLL_MAX_IN_FLIGHT,
+                             coalesce_window=DEVICE_POLL_COALESCE_MS / 1000)
+
+ingest_buffer = None
+if INGEST_BUFFER_ENABLED:
+    ingest_buffer = IngestBuffer(plant_data_store,
+                                 max_batch=INGEST_BUFFER_MAX_BATCH,
+                                 flush_interval_ms=INGEST_BUFFER_FLUSH_MS,
+                                 max_queue=INGEST_BUFFER_MAX_QUEUE)
+
+# Gauges que se leen al consultar /metrics
+metrics.SCHEDULER_JOBS.set_function(lambda: len(scheduler.get_jobs()) if scheduler.running else 0)
+metrics.DEVICE_POLLER_PENDING.set_function(lambda: device_poller.stats()['pending'])
+metrics.INGEST_BUFFER_QUEUED.set_function(lambda: ingest_buffer.stats()['queue_depth'] if ingest_buffer is not None else 0)
 
 
 # Get current assigned IP using hostname command on Linux
@@ -95,7 +209,7 @@ plant_registration_schema = {
         "plant_name": {"type": 'string'},
         "plant_type": {"type": 'string'},
         "plant_date": {"type": 'integer'},
-        "plant_update_poll": {"type": 'integer'},
+        "plant_update_poll": {"type": 'integer', "minimum": 1},
         "update_poll_activated": {"type": 'boolean'},
         "device_mac": {"type": 'string'},
         "soil_sens_num": {"type": 'integer'}
@@ -104,57 +218,173 @@ plant_registration_schema = {
     "validationAction": "error" 
 }
 
-def curl_post_device(plant_id, device_ip, sensor_num):
-    try:
-        buffer = BytesIO()
-        c = pycurl.Curl()
-        url = f'http://{device_ip}/data/'
-        data = {"sensor_num": sensor_num, "plant_id": plant_id}
-        json_data = json.dumps(data)
-
-        c.setopt(c.URL, url)
-        c.setopt(pycurl.HTTPHEADER, ['Content-Type: application/json']) # Set content type for JSON
-        c.setopt(c.POSTFIELDS, json_data)
-        c.setopt(c.WRITEFUNCTION, buffer.write)
-
-        c.perform()
-
-        response_body = buffer.getvalue().decode('utf-8')
-        print(f'[ OK ] Recieved response from {device_ip}: {response_body}')
-        c.close()
-    except pycurl.error as e:
-        print(f'[ERROR] Could not connect to device pycurl: {e}')
-        c.close()
+def ensure_indexes():
+    """Crea los indices de las consultas de la API; create_index no hace nada si el indice ya existe"""
+    for collection, field in ((plant_collection, 'plant_id'), (device_collection, 'mac')):
+        try:
+            collection.create_index([(field, ASCENDING)], name=f'{field}_unique', unique=True)
+        except OperationFailure as e:
+            # Documentos duplicados de antes del indice; las consultas siguen sin indice hasta limpiarlos
+            logger.error('Could not create unique index on %s.%s, remove the duplicated documents: %s', collection.name, field, e)
+    plant_data_store.ensure_collection()
+    rollup_store.ensure_collections()
+    node_cluster.ensure_indexes()
+    logger.info('Plant data storage verified (layout: %s)', plant_data_store.layout)
+    if plant_data_store.layout != 'flat' and plant_data_collection.estimated_document_count() and not plant_data_store.count():
+        logger.warning('Readings found in the legacy plant_data collection. Run "python manage.py copy-layout" to copy them')
+
+def encode_cursor(doc):
+    raw = json.dumps([doc['timestamp'], str(doc['_id'])]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    timestamp, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if not valid_timestamp(timestamp):
+        raise ValueError('Invalid cursor timestamp')
+    return timestamp, ObjectId(object_id)
+
+def query_plant_data(plant_id, start=None, end=None, limit=None, cursor=None):
+    """Regresa una pagina de lecturas de una planta ordenadas por (timestamp, _id) y el cursor de la siguiente"""
+    limit = min(limit or PLANT_DATA_DEFAULT_LIMIT, PLANT_DATA_MAX_LIMIT)
+    after = decode_cursor(cursor) if cursor else None
+    # Pedir un documento extra para saber si existe una pagina siguiente
+    plant_data = list(plant_data_reader.find(plant_id, start, end, after, limit=limit + 1))
+    next_cursor = None
+    if len(plant_data) > limit:
+        plant_data = plant_data[:limit]
+        next_cursor = encode_cursor(plant_data[-1])
+    for doc in plant_data:
+        del doc['_id']
+    return plant_data, next_cursor
+
+def wants_stream():
+    """Modo streaming: ?stream=1 o Accept: application/x-ndjson"""
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
 
-def curl_ping_device(device_ip):
-    try:
-        buffer = BytesIO()
-        c = pycurl.Curl()
-        url = f'http://{device_ip}/ping/'
+def ndjson_response(documents):
+    """Envia lecturas de plant_data_reader.find como NDJSON, un lote a la vez, sin cargar toda la coleccion en memoria"""
 
-        c.setopt(c.URL, url)
-        c.setopt(c.WRITEDATA, buffer)
-        c.perform()
+    def generate():
+        try:
+            lines = []
+            for doc in documents:
+                doc.pop('_id', None)
+                lines.append(json.dumps(doc, separators=(',', ':')))
+                if len(lines) >= PLANT_DATA_STREAM_BATCH_SIZE:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                yield '\n'.join(lines) + '\n'
+        finally:
+            documents.close()
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+def plant_data_response(plant_id, start, end, limit, cursor):
+    try:
+        start = parse_timestamp(start)
+        end = parse_timestamp(end)
+        limit = int(limit) if limit else None
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be at least 1')
+        if wants_stream():
+            # En streaming se envia todo el rango pedido; limit es opcional
+            after = decode_cursor(cursor) if cursor else None
+            if limit is not None:
+                limit = min(limit, PLANT_DATA_STREAM_MAX_LIMIT)
+            documents = plant_data_reader.find(plant_id, start, end, after, limit=limit,
+                                              batch_size=PLANT_DATA_STREAM_BATCH_SIZE)
+            logger.debug('[PLANT_DATA][GET] Streaming plant_id %s records', plant_id)
+            return ndjson_response(documents), 200
+        plant_data, next_cursor = query_plant_data(plant_id, start, end, limit, cursor)
+    except (TypeError, ValueError, InvalidId):
+        return 'Error: Invalid from, to, limit or cursor value\n', 400
+    logger.debug('[PLANT_DATA][GET] Sending plant_id %s records: %d', plant_id, len(plant_data))
+    if not plant_data and start is None and end is None and not cursor:
+        return 'Error: Plant ID Not Found\n', 404
+    response = jsonify(plant_data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+def listing_response(name, collection):
+    """Listado completo de una coleccion desde listing_cache, con ETag.
+
+    Un If-None-Match con el ETag vigente recibe 304 sin cuerpo; si el listado esta en
+    cache no se consulta la coleccion.
+    """
+    etag, body = listing_cache.get(name, lambda: current_app.json.response(list(collection.find({}, {'_id': 0}))).get_data())
+    # Si la respuesta anterior iba comprimida el cliente manda el ETag con el encoding
+    matched = next((tag for tag in response_compressor.encoded_etags(etag) if request.if_none_match.contains(tag)), None)
+    if matched is not None:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+    # El cliente puede guardar la respuesta pero debe revalidarla en cada request
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-        response_body = buffer.getvalue().decode('utf-8')
-        # print(response_body)
+def poll_plant(plant_id, device_ip, sensor_num):
+    """Job del scheduler: encola la lectura en el poller y regresa de inmediato"""
+    device_poller.submit(plant_id, device_ip, sensor_num)
 
-        c.close()
-        return True
-    except pycurl.error as e:
-        print(f'[ERROR] Could not connect to device pycurl: {e}')
-        c.close()
-        return False
+def curl_ping_device(device_ip):
+    return device_client.ping(device_ip)
+
+def poll_job_start_date(device_mac, interval):
+    """Primer disparo de un job de polling: un desfase fijo dentro del intervalo segun la MAC.
+
+    Los jobs con el mismo intervalo ya no se disparan todos en el mismo instante. Las
+    plantas de un mismo dispositivo comparten desfase, asi que el poller las junta en un
+    solo request a /data_multi/ en lugar de abrir varias conexiones al ESP8266.
+    """
+    interval_ms = int(interval * 1000)
+    offset = zlib.crc32(device_mac.encode('utf-8')) % interval_ms / 1000
+    now = time.time()
+    start = now - now % interval + offset
+    if start <= now:
+        start += interval
+    return datetime.fromtimestamp(start, timezone.utc)
+
+def valid_poll_interval(interval):
+    """Intervalo de polling en segundos que el scheduler puede usar; plantas viejas pueden tener 0 o null"""
+    return isinstance(interval, (int, float)) and not isinstance(interval, bool) and interval > 0
+
+def add_poll_job(plant_id, device_mac, device_ip, soil_sens_num, interval):
+    if not valid_poll_interval(interval):
+        logger.warning('Invalid poll interval %r for plant %s, scheduler job not added', interval, plant_id)
+        return None
+    return scheduler.add_job(
+        id=f'{plant_id}',
+        func=poll_plant,
+        args=[plant_id, device_ip, soil_sens_num],
+        trigger="interval",
+        seconds=interval,
+        start_date=poll_job_start_date(device_mac, interval),
+        jitter=SCHEDULER_JOB_JITTER_SECONDS or None,
+        replace_existing=True
+    )
 
 def update_scheduler_job(plant_id, device_mac, interval, soil_sens_num, reason=""):
     """Función auxiliar para actualizar el job del scheduler"""
-    device = device_collection.find_one({'mac': device_mac})
+    if not scheduler.running:
+        # El scheduler corre en otro worker; lo toma de la base de datos en sync_poll_jobs
+        logger.debug('Scheduler runs in another process, job for %s will be updated on the next sync', plant_id)
+        return False
+    if not node_cluster.owns(device_mac):
+        logger.debug('Device %s is polled by another node, job for %s not updated', device_mac, plant_id)
+        return False
+    device = device_registry.get(device_mac)
     if device is None:
-        print(f'\t[WARNING] Device {device_mac} not found in database, scheduler job not updated')
+        logger.warning('Device %s not found in database, scheduler job not updated', device_mac)
         return False
     
     if not curl_ping_device(device['latest_ip']):
-        print(f'\t[WARNING] Device {device_mac} is not reachable, scheduler job not updated')
+        logger.warning('Device %s is not reachable, scheduler job not updated', device_mac)
         return False
     
     try:
@@ -162,80 +392,225 @@ def update_scheduler_job(plant_id, device_mac, interval, soil_sens_num, reason="
     except:
         pass  # El job puede no existir
     
-    job_id = scheduler.add_job(
-        id=f'{plant_id}',
-        func=curl_post_device,
-        args=[plant_id, device['latest_ip'], soil_sens_num],
-        trigger="interval",
-        seconds=interval
-    )
-    print(f'\t[LOG] Updated scheduler job for {plant_id} (interval: {interval}s, sensor: {soil_sens_num}){f" - {reason}" if reason else ""}')
+    job_lag_tracker.forget(plant_id)
+    add_poll_job(plant_id, device_mac, device['latest_ip'], soil_sens_num, interval)
+    logger.info('Updated scheduler job for %s (interval: %ss, sensor: %s)%s', plant_id, interval, soil_sens_num, f' - {reason}' if reason else '')
     return True
 
 def load_request_jobs(plants_entry):
+    phase_start = time.perf_counter()
+    # Una sola consulta para todos los dispositivos de las plantas
+    devices = device_registry.get_many({plant['device_mac'] for plant in plants_entry})
+    logger.info('Startup device lookup: %d devices (%.1fms)', len(devices), (time.perf_counter() - phase_start) * 1000)
+
+    # Cada dispositivo se consulta una sola vez, en paralelo
+    phase_start = time.perf_counter()
+    device_ips = {device['latest_ip'] for device in devices.values()}
+    with ThreadPoolExecutor(max_workers=STARTUP_PING_WORKERS) as executor:
+        reachable = dict(zip(device_ips, executor.map(curl_ping_device, device_ips)))
+    logger.info('Startup device ping: %d/%d reachable (%.1fms)', sum(reachable.values()), len(device_ips), (time.perf_counter() - phase_start) * 1000)
+
+    phase_start = time.perf_counter()
+    scheduled = 0
     for plant in plants_entry:
-        device = device_collection.find_one({'mac': plant['device_mac']})
+        device = devices.get(plant['device_mac'])
         if device is not None:
-            if curl_ping_device(device['latest_ip']):
-                print(f'[LOG] Pinging {plant["plant_name"]} on {device["latest_ip"]}')
-                job_id = scheduler.add_job(id=f'{plant["plant_id"]}' ,func=curl_post_device, args=[plant['plant_id'],device['latest_ip'], plant['soil_sens_num']], trigger="interval", seconds=plant['plant_update_poll'])
-                print(f'[LOG] Ping successful, adding to scheduler: {job_id}')
+            if reachable[device['latest_ip']]:
+                logger.debug('Pinging %s on %s', plant['plant_name'], device['latest_ip'])
+                job_id = add_poll_job(plant['plant_id'], plant['device_mac'], device['latest_ip'], plant['soil_sens_num'], plant.get('plant_update_poll'))
+                if job_id is None:
+                    continue
+                logger.info('Ping successful, adding to scheduler: %s', job_id)
+                scheduled += 1
             else:
-                print(f'[WARING] Ping unsuccessful, ignoring')
+                logger.warning('Ping unsuccessful for %s on %s, ignoring', plant['plant_name'], device['latest_ip'])
         else:
-            print('[WARN] Could not find device assigned to plant! Skipping scheduling job')
+            logger.warning('Could not find device assigned to plant %s! Skipping scheduling job', plant['plant_id'])
+    logger.info('Startup job registration: %d jobs (%.1fms)', scheduled, (time.perf_counter() - phase_start) * 1000)
 
 def load_scheduler_jobs_at_startup():
-    print("\n[LOG] Attempting to look for plant entries in DB ...\n")
-    plants_entry = list(plant_collection.find())
+    startup_start = time.perf_counter()
+    logger.info('Attempting to look for plant entries in DB ...')
+    plants_entry = list(plant_collection.find(POLLING_PLANTS_QUERY))
+    logger.info('Startup plant lookup: %d plants (%.1fms)', len(plants_entry), (time.perf_counter() - startup_start) * 1000)
+    device_macs = {plant['device_mac'] for plant in plants_entry}
+    owned = node_cluster.assign(device_macs)
+    node_cluster.release(keep=owned)
+    plants_entry = [plant for plant in plants_entry if plant['device_mac'] in owned]
+    logger.info('Node %s polls %d/%d devices (%d live nodes)', NODE_ID, len(owned), len(device_macs), len(node_cluster.stats()['live_nodes']))
     if len(plants_entry) != 0:
-        print(f'[LOG] Found {len(plants_entry)} plants!')
+        logger.info('Found %d plants!', len(plants_entry))
         load_request_jobs(plants_entry)
     else:
-        print("[LOG] There are no device entries en the database")
+        logger.info('There are no device entries en the database')
+    logger.info('Scheduler startup finished in %.1fms', (time.perf_counter() - startup_start) * 1000)
+
+def sync_poll_jobs():
+    """Job del scheduler: ajusta los jobs de polling a lo que hay en plant_collection.
+
+    Aplica los cambios que el proceso dueno del scheduler no vio: plantas registradas,
+    borradas o editadas en otro worker, y cambios de IP de los dispositivos. Tambien
+    renueva el lease del nodo y aplica el reparto de dispositivos entre nodos.
+    """
+    plants = {plant['plant_id']: plant for plant in plant_collection.find(POLLING_PLANTS_QUERY, {'_id': 0})}
+    owned = node_cluster.assign({plant['device_mac'] for plant in plants.values()})
+    plants = {plant_id: plant for plant_id, plant in plants.items() if plant['device_mac'] in owned}
+    jobs = {job.id: job for job in scheduler.get_jobs() if job.id not in INTERNAL_JOB_IDS}
+    for plant_id in jobs.keys() - plants.keys():
+        scheduler.remove_job(plant_id)
+        job_lag_tracker.forget(plant_id)
+        logger.info('Removed scheduler job for %s (plant deleted, polling deactivated or device moved to another node)', plant_id)
+    # Hasta quitar los jobs se sueltan los dispositivos que ahora le tocan a otro nodo
+    node_cluster.release(keep=owned)
+
+    devices = device_registry.get_many({plant['device_mac'] for plant in plants.values()})
+    changed = []
+    for plant in plants.values():
+        device = devices.get(plant['device_mac'])
+        if device is None or not valid_poll_interval(plant.get('plant_update_poll')):
+            continue
+        job = jobs.get(plant['plant_id'])
+        if (job is None
+                or tuple(job.args) != (plant['plant_id'], device['latest_ip'], plant.get('soil_sens_num'))
+                or job.trigger.interval.total_seconds() != plant['plant_update_poll']):
+            changed.append((plant, device))
+    if not changed:
+        return
+
+    device_ips = {device['latest_ip'] for _, device in changed}
+    with ThreadPoolExecutor(max_workers=STARTUP_PING_WORKERS) as executor:
+        reachable = dict(zip(device_ips, executor.map(curl_ping_device, device_ips)))
+    for plant, device in changed:
+        # Igual que al arrancar: los dispositivos que no responden se reintentan en el siguiente sync
+        if reachable[device['latest_ip']]:
+            add_poll_job(plant['plant_id'], plant['device_mac'], device['latest_ip'], plant.get('soil_sens_num'), plant['plant_update_poll'])
+            logger.info('Synced scheduler job for %s (interval: %ss, device: %s)', plant['plant_id'], plant['plant_update_poll'], device['latest_ip'])
+
+def archive_old_readings():
+    """Job del scheduler: mueve a disco las lecturas con mas de ARCHIVE_AFTER_DAYS dias"""
+    cold_archive.archive(plant_data_store, int(time.time()) - ARCHIVE_AFTER_DAYS * 86400)
+
+def start_scheduler():
+    """Arranca el poller y el scheduler con los jobs de plant_collection"""
+    # atexit corre en orden inverso: los dispositivos se sueltan despues de detener el poller
+    atexit.register(node_cluster.leave)
+    device_poller.start()
+    atexit.register(device_poller.stop)
+    load_scheduler_jobs_at_startup()
+    scheduler.add_job(id=SYNC_JOB_ID, func=sync_poll_jobs, trigger="interval", seconds=SCHEDULER_SYNC_SECONDS)
+    if ARCHIVE_AFTER_DAYS > 0 and not plant_data_store.can_delete_readings():
+        # Sin esto cada lote se escribiria a disco y el borrado en Mongo fallaria en cada corrida
+        logger.error('ARCHIVE_AFTER_DAYS is set but the %s layout cannot delete archived readings on this MongoDB server '
+                     '(needs MongoDB 7.0), the archiver is disabled', plant_data_store.layout)
+    elif ARCHIVE_AFTER_DAYS > 0:
+        scheduler.add_job(id=ARCHIVE_JOB_ID, func=archive_old_readings, trigger="interval", seconds=ARCHIVE_INTERVAL_SECONDS)
+    scheduler.start()
+
+def wait_for_scheduler_lock():
+    """Hilo de los workers sin scheduler: lo toman si el proceso dueno muere"""
+    while not scheduler_lock.acquire():
+        time.sleep(SCHEDULER_LOCK_RETRY_SECONDS)
+    logger.info('Acquired scheduler lock %s, starting scheduler in process %d', SCHEDULER_LOCK_FILE, os.getpid())
+    start_scheduler()
+
+def create_app(run_scheduler=True):
+    """Crea la app de Flask y arranca los servicios en segundo plano del proceso.
+
+    Se llama una vez por proceso (cada worker de gunicorn, ver wsgi.py). Solo el proceso
+    que toma SCHEDULER_LOCK_FILE corre el scheduler y el poller; los demas atienden la
+    API y escriben los cambios de plantas en Mongo, donde el dueno los toma con
+    sync_poll_jobs. La API /scheduler/jobs de Flask-APScheduler responde con los jobs del
+    proceso que atiende el request.
+
+    Con `run_scheduler=False` solo se atiende la API (benchmarks en el mismo proceso).
+    """
+    app = Flask(__name__)
+    app.config.from_object(APScheduler_Config)
+    schema.init_app(app)
+    app.register_blueprint(api)
+    scheduler.init_app(app)
+    scheduler.add_listener(metrics.record_scheduler_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    scheduler.add_listener(job_lag_tracker.record, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+    ensure_indexes()
+    if ingest_buffer is not None:
+        ingest_buffer.start()
+        atexit.register(ingest_buffer.stop)
+    logger.info('Loaded %d devices into the device registry', device_registry.load())
+    logger.info('Loaded %d latest plant sensor readings', latest_readings.seed())
+    if not run_scheduler:
+        return app
+    if scheduler_lock.acquire():
+        logger.info('Acquired scheduler lock %s in process %d', SCHEDULER_LOCK_FILE, os.getpid())
+        start_scheduler()
+    else:
+        logger.info('Scheduler lock %s is held by another process, process %d only serves the API', SCHEDULER_LOCK_FILE, os.getpid())
+        threading.Thread(target=wait_for_scheduler_lock, name='scheduler-lock', daemon=True).start()
+    return app
 
 # This causes scheduler shutdown when there is any other call to the app, ex. /scheduler
 # @app.teardown_appcontext
 # def stop_scheduler(exception=None):
 #     scheduler.shutdown()
 
-@app.errorhandler(JsonValidationError)
+@api.app_errorhandler(JsonValidationError)
 def validation_error(e):
     return jsonify({'error': e.message, 'errors': [validation_error.message for validation_error in e.errors]}),406
 
-@app.route('/')
-@app.route('/index')
+@api.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@api.after_app_request
+def record_request_metrics(response):
+    # Se etiqueta con la regla de la ruta (/plant/<plant_id>) y no con la URL, para no crear una serie por planta
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.record_request(route, request.method, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+@api.after_app_request
+def compress_response(response):
+    # Registrado despues de las metricas, asi que corre antes (Flask los llama en orden inverso)
+    if not COMPRESSION_ENABLED:
+        return response
+    return response_compressor.compress(request, response)
+
+@api.route('/')
+@api.route('/index')
 def index():
     return f"Raspberry Pi4 4G on {ip}\nAdd /hello for a surprise :)", 200
 
 # [TODO] Change this to a better health_check instead of a device handler
-@app.route('/health_check', methods=['POST'])
+@api.route('/health_check', methods=['POST'])
 def recieve_device_info():
     if request.method == "POST":
         data = request.json
-        print(f'[LOG] Device {data["dev_type"]} with MAC {data["dev_mac_addr"]} connected via {data["session_ip"]} at: {datetime.now()}')
-        device_entry = device_collection.find_one({"mac": data["dev_mac_addr"]})
-        print(f'[DEBUG] [LOG] Device entry: {device_entry}')
+        logger.debug('[HEALTH_CHECK] Device %s with MAC %s connected via %s', data['dev_type'], data['dev_mac_addr'], data['session_ip'])
+        device_entry = device_registry.get(data["dev_mac_addr"])
+        logger.debug('[HEALTH_CHECK] Device entry: %s', device_entry)
         if device_entry == None:
-            print(f'[NEW DEVICE] New {data["dev_type"]} Device detected with MAC: {data["dev_mac_addr"]} on {data["session_ip"]}')
-            device_collection.insert_one({"name": data["dev_type"], "mac": data["dev_mac_addr"], "latest_ip": data["session_ip"], "sensor_list": data["sensors_detected"]})
+            logger.info('[NEW DEVICE] New %s Device detected with MAC: %s on %s', data['dev_type'], data['dev_mac_addr'], data['session_ip'])
+            device_registry.add({"name": data["dev_type"], "mac": data["dev_mac_addr"], "latest_ip": data["session_ip"], "sensor_list": data["sensors_detected"]})
+            listing_cache.bump('devices')
         else:
             if data['session_ip'] == device_entry['latest_ip']:
-                print(f'[ OK ] Connecting {data["dev_type"]} device to {data["dev_mac_addr"]} on {data["session_ip"]}')
+                logger.debug('[HEALTH_CHECK] Connecting %s device to %s on %s', data['dev_type'], data['dev_mac_addr'], data['session_ip'])
             else:
-                print(f'[UPDATE] New ip detected for {data["dev_type"]} with MAC: {data["dev_mac_addr"]} on  {data["session_ip"]}. Previous was {device_entry["latest_ip"]}')
-                device_collection.update_one({"mac": data["dev_mac_addr"]}, {"$set": {"name": data["dev_type"], "mac": data["dev_mac_addr"], "latest_ip": data["session_ip"] , "sensor_list": data["sensors_detected"]}})
+                logger.info('[UPDATE] New ip detected for %s with MAC: %s on %s. Previous was %s', data['dev_type'], data['dev_mac_addr'], data['session_ip'], device_entry['latest_ip'])
+                device_client.forget(device_entry["latest_ip"])
+                device_registry.update(data["dev_mac_addr"], {"name": data["dev_type"], "mac": data["dev_mac_addr"], "latest_ip": data["session_ip"] , "sensor_list": data["sensors_detected"]})
+                listing_cache.bump('devices')
             
         return 'Connection OK!', 200
 
-@app.route('/device', methods=['POST', 'UPDATE', 'DELETE', 'GET'])
+@api.route('/device', methods=['POST', 'UPDATE', 'DELETE', 'GET'])
 def device_handler():
     if request.method == 'POST':
         data = request.json
-        device_entry = device_collection.find_one({"mac": data["dev_mac_addr"]})
+        device_entry = device_registry.get(data["dev_mac_addr"])
         if device_entry == None:
-            print(f'[NEW DEVICE] New {data["dev_type"]} Device detected with MAC: {data["dev_mac_addr"]} on {data["session_ip"]}')
-            device_collection.insert_one(
+            logger.info('[NEW DEVICE] New %s Device detected with MAC: %s on %s', data['dev_type'], data['dev_mac_addr'], data['session_ip'])
+            device_registry.add(
                 {
                     "name": data["dev_type"], 
                     "mac": data["dev_mac_addr"], 
@@ -243,13 +618,12 @@ def device_handler():
                     "sensor_list": data["sensors_detected"]
                 }
             )
+            listing_cache.bump('devices')
             return 'Device added successfuly\n', 200
         return 'Error: No information sent', 404 
     elif request.method == 'GET':
-        print(f'[DEVICE][GET] Device list request')
-        devices = list(device_collection.find({}, {'_id': 0}))
-        print(f'[DEVICE][GET] {devices}\n')
-        return jsonify(devices), 200
+        logger.debug('[DEVICE][GET] Device list request')
+        return listing_response('devices', device_collection)
     elif request.method == 'DELETE':
         # [TODO]
         return 'Not implemented yet\n', 501
@@ -260,16 +634,14 @@ def device_handler():
         return 'Not Found\n', 404
 
 
-@app.route('/garden', methods=['POST', 'UPDATE', 'DELETE', 'GET'])
+@api.route('/garden', methods=['POST', 'UPDATE', 'DELETE', 'GET'])
 def garden_handler():
     if request.method == 'POST':
         # [TODO]
         return 'Not implemented yet\n', 501
     elif request.method == 'GET':
-        print(f'[GARDEN][GET] Garden list request')
-        gardens = list(garden_collection.find({}, {'_id': 0}))
-        print(f'[GARDEN][GET] {gardens}\n')
-        return jsonify(gardens), 200
+        logger.debug('[GARDEN][GET] Garden list request')
+        return listing_response('gardens', garden_collection)
     elif request.method == 'DELETE':
         # [TODO]
         return 'Not implemented yet\n', 501
@@ -279,12 +651,12 @@ def garden_handler():
     else:
         return 'Not Found\n', 404
 
-@app.route('/plant/<plant_id>', methods=['POST', 'UPDATE', 'DELETE', 'GET'])
+@api.route('/plant/<plant_id>', methods=['POST', 'UPDATE', 'DELETE', 'GET'])
 def single_plant_handler(plant_id):
     if request.method == 'GET':
         # data = request.json
         # plant_id = data.get("plant_id")
-        print(f'[PLANT][GET][ID] Plant request {plant_id}')
+        logger.debug('[PLANT][GET][ID] Plant request %s', plant_id)
         found_plant = plant_collection.find_one({'plant_id': plant_id}, {'_id': 0})
         if found_plant:
             return jsonify(found_plant), 200
@@ -292,52 +664,70 @@ def single_plant_handler(plant_id):
     return 'Not implemented yet\n', 501
 
 
-@app.route('/plant', methods=['POST', 'UPDATE', 'DELETE', 'GET', 'PUT']) 
+@api.route('/plant/<plant_id>/latest', methods=['GET'])
+def latest_plant_reading_handler(plant_id):
+    # Ultima lectura de cada sensor de la planta, sin consultar el historial
+    logger.debug('[PLANT][LATEST] Plant: %s latest reading request', plant_id)
+    readings = latest_readings.get(plant_id)
+    if not readings:
+        return 'Error: Plant ID Not Found\n', 404
+    return jsonify(sorted(readings, key=lambda doc: str(doc.get('sensor_num')))), 200
+
+
+@api.route('/plant/latest', methods=['GET'])
+def latest_readings_handler():
+    # {plant_id: [ultima lectura de cada sensor]}
+    logger.debug('[PLANT][LATEST] Latest readings of all plants request')
+    readings = latest_readings.get_all()
+    return jsonify({plant_id: sorted(docs, key=lambda doc: str(doc.get('sensor_num'))) for plant_id, docs in readings.items()}), 200
+
+
+@api.route('/plant', methods=['POST', 'UPDATE', 'DELETE', 'GET', 'PUT']) 
 def plant_handler():
     if request.method == 'POST':
         # Validar schema solo para POST
-        try:
-            schema.validate(request.json, plant_registration_schema)
-        except JsonValidationError as e:
-            return jsonify({'error': e.message, 'errors': [validation_error.message for validation_error in e.errors]}), 406
+        # schema.validate es un decorador; llamado aqui no validaba nada
+        validator = validator_for(plant_registration_schema)(plant_registration_schema)
+        errors = [error.message for error in validator.iter_errors(request.get_json(silent=True))]
+        if errors:
+            return jsonify({'error': 'Error validating against schema', 'errors': errors}), 406
         data = request.json
-        assigned_uuid = str(uuid.uuid4()).split('-')[0] # [TODO] Add Validation in case uuid already exists
         date_registered = int(time.time())
-        print(f'[PLANT][POST] Recieved new Plant')
-        print(f"\tUUID: {assigned_uuid}")
-        print(f"\tPlant Name: {data.get('plant_name')}")
-        print(f"\tPlant Type: {data.get('plant_type')}")
-        print(f"\tDate Planted: {data.get('plant_date')}")
-        print(f"\tDate Registered: {date_registered}")
-        print(f"\tData Update: {data.get('plant_update_poll')}")
-        print(f"\tData Polling activated: {data.get('update_poll_activated')}")
-        print(f"\tDevice Id (MAC): {data.get('device_mac')}")
-        print(f"\tSensor number: {data.get('soil_sens_num')}")
-        plant_collection.insert_one(
-            {
-                'plant_id': assigned_uuid,
-                'plant_name': data.get('plant_name'),
-                'plant_type': data.get('plant_type'),
-                'plant_date': data.get('plant_date'),
-                'plant_registered': date_registered,
-                'plant_update_poll': data.get('plant_update_poll'),
-                'update_poll_activated': data.get('update_poll_activated'),
-                'device_mac': data.get('device_mac'),
-                'soil_sens_num': data.get('soil_sens_num')
-            }
-        )
+        plant = {
+            'plant_name': data.get('plant_name'),
+            'plant_type': data.get('plant_type'),
+            'plant_date': data.get('plant_date'),
+            'plant_registered': date_registered,
+            'plant_update_poll': data.get('plant_update_poll'),
+            'update_poll_activated': data.get('update_poll_activated'),
+            'device_mac': data.get('device_mac'),
+            'soil_sens_num': data.get('soil_sens_num')
+        }
+        # El indice unico de plant_id rechaza un ID repetido; se genera otro
+        for _ in range(PLANT_ID_ATTEMPTS):
+            assigned_uuid = str(uuid.uuid4()).split('-')[0]
+            try:
+                plant_collection.insert_one({'plant_id': assigned_uuid, **plant})
+                break
+            except DuplicateKeyError:
+                logger.warning('[PLANT][POST] Plant ID %s already exists, generating another one', assigned_uuid)
+        else:
+            return jsonify({ 'success': False, 'message': 'Error: Could not assign a unique plant ID' }), 500
+        listing_cache.bump('plants')
+        logger.info('[PLANT][POST] Recieved new Plant %s (%s) on device %s sensor %s',
+                    assigned_uuid, data.get('plant_name'), data.get('device_mac'), data.get('soil_sens_num'))
+        logger.debug('[PLANT][POST] Plant Type: %s, Date Planted: %s, Date Registered: %s, Data Update: %s, Data Polling activated: %s',
+                     data.get('plant_type'), data.get('plant_date'), date_registered, data.get('plant_update_poll'), data.get('update_poll_activated'))
         return jsonify({ 'success': True, 'message': 'Added to DB' }), 200
     elif request.method == 'GET':
         if not request.data:
-            print(f'[PLANT][GET] Plant list request')
-            plants = list(plant_collection.find({}, {'_id': 0}))
-            print(f'[PLANT][GET] {plants}\n')
-            return jsonify(plants), 200
+            logger.debug('[PLANT][GET] Plant list request')
+            return listing_response('plants', plant_collection)
         else:
             data = request.json
             if data.get('plant_id'):
                 plant_id = data.get("plant_id")
-                print(f'[PLANT][GET][ID] Plant request {plant_id}')
+                logger.debug('[PLANT][GET][ID] Plant request %s', plant_id)
                 found_plant = plant_collection.find_one({'plant_id': plant_id}, {'_id': 0})
                 if found_plant:
                     return jsonify(found_plant), 200
@@ -349,9 +739,10 @@ def plant_handler():
             data = request.json
             if data.get('plant_id'):
                 plant_id = data.get('plant_id')
-                print(f'[PLANT][DELETE][ID] Delete Plant: {plant_id}')
+                logger.info('[PLANT][DELETE][ID] Delete Plant: %s', plant_id)
                 deleted_plant = plant_collection.delete_one({'plant_id': plant_id})
                 if deleted_plant.deleted_count:
+                    listing_cache.bump('plants')
                     return f'Plant {plant_id} Deleted Successfully\n', 200
                 return f'Plant {plant_id} NOT Found!\n', 404
         return 'Error: No ID provided\n', 404
@@ -369,15 +760,17 @@ def plant_handler():
         if not found_plant:
             return jsonify({'success': False, 'message': 'Plant ID not found'}), 404
         
-        print(f'[PLANT][UPDATE][ID] Update Plant: {plant_id}')
+        logger.info('[PLANT][UPDATE][ID] Update Plant: %s', plant_id)
+        if data.get('plant_update_poll') is not None and not valid_poll_interval(data.get('plant_update_poll')):
+            return jsonify({'success': False, 'message': 'Error: plant_update_poll must be a positive number of seconds'}), 400
         
         # Campos no editables
         if 'plant_id' in data:
-            print(f'\t[WARNING] plant_id cannot be modified, ignoring')
+            logger.debug('[PLANT][UPDATE][ID] plant_id cannot be modified, ignoring')
         if 'plant_registered' in data:
-            print(f'\t[WARNING] plant_registered cannot be modified, ignoring')
+            logger.warning('[PLANT][UPDATE][ID] plant_registered cannot be modified, ignoring')
         if data.get('device_mac') is not None:
-            print(f'\t[WARNING] device_mac cannot be modified, ignoring')
+            logger.warning('[PLANT][UPDATE][ID] device_mac cannot be modified, ignoring')
         
         # Construir diccionario de actualización
         update_fields = {}
@@ -386,7 +779,7 @@ def plant_handler():
         for field in editable_fields:
             if data.get(field) is not None:
                 update_fields[field] = data.get(field)
-                print(f'\t{field.replace("_", " ").title()}: {data.get(field)}')
+                logger.debug('[PLANT][UPDATE][ID] %s: %s', field.replace('_', ' ').title(), data.get(field))
         
         # Manejar actualización del scheduler si es necesario
         device_mac = found_plant.get('device_mac')
@@ -398,19 +791,21 @@ def plant_handler():
         if data.get('update_poll_activated') is not None and not update_poll_activated:
             try:
                 scheduler.remove_job(plant_id)
-                print(f'\t[LOG] Removed scheduler job for {plant_id} (polling deactivated)')
+                job_lag_tracker.forget(plant_id)
+                logger.info('Removed scheduler job for %s (polling deactivated)', plant_id)
             except:
                 pass
         # Si se actualiza intervalo, sensor, o se activa polling, actualizar scheduler
         elif (data.get('plant_update_poll') is not None or data.get('soil_sens_num') is not None or 
-              (data.get('update_poll_activated') is not None and update_poll_activated)) and update_poll_activated and plant_update_poll:
+              (data.get('update_poll_activated') is not None and update_poll_activated)) and update_poll_activated and valid_poll_interval(plant_update_poll):
             update_scheduler_job(plant_id, device_mac, plant_update_poll, soil_sens_num)
         
         # Actualizar en la base de datos
         if update_fields:
             result = plant_collection.update_one({'plant_id': plant_id}, {'$set': update_fields})
             if result.modified_count > 0:
-                print(f'[PLANT][UPDATE][ID] Plant {plant_id} updated successfully')
+                listing_cache.bump('plants')
+                logger.info('[PLANT][UPDATE][ID] Plant %s updated successfully', plant_id)
                 return jsonify({'success': True, 'message': f'Plant {plant_id} updated successfully'}), 200
             else:
                 return jsonify({'success': False, 'message': 'No changes were made'}), 200
@@ -421,68 +816,174 @@ def plant_handler():
     else:
         return 'Not implemented\n', 501
 
-@app.route('/plant_data/<plant_id>', methods=['POST', 'GET', 'DELETE'])
+@api.route('/plant_data/<plant_id>', methods=['POST', 'GET', 'DELETE'])
 def single_plant_data_handler(plant_id):
     if request.method == 'GET':
-        # data = request.json 
-        # plant_id = data.get('plant_id')
-        #if data.get('dates'):
-        #    # [TODO]: implement a date query method
-        #    return 'Not implemented yet', 501
-        print(f'[PLANT_DATA][GET] Plant: {plant_id} data request')
-        plant_data = list(plant_data_collection.find({'plant_id': plant_id}, {'_id': 0}))
-        print(f'[PLANT_DATA][GET] Sending plant_id {plant_id} records: {len(plant_data)}\n')
-        # print(plant_data)
-        if not any(plant_data):
-            return 'Error: Plant ID Not Found\n', 404
-    return jsonify(plant_data), 200
-
-
-@app.route('/plant_data', methods=['POST', 'GET', 'DELETE'])
+        # Query params: from, to (unix timestamp o ISO 8601), limit y cursor (header X-Next-Cursor de la pagina anterior)
+        logger.debug('[PLANT_DATA][GET] Plant: %s data request', plant_id)
+        return plant_data_response(plant_id,
+                                        request.args.get('from'),
+                                        request.args.get('to'),
+                                        request.args.get('limit'),
+                                        request.args.get('cursor'))
+    return 'Not implemented yet\n', 501
+
+
+@api.route('/plant_data/export', methods=['GET'])
+def plant_data_export_handler():
+    # Query params: format (csv, parquet o arrow), plant_id (separados por coma, default todas),
+    # from, to y profile=notebook para las columnas del notebook de entrenamiento
+    export_format = request.args.get('format', 'csv')
+    profile = request.args.get('profile', 'default')
+    if export_format not in EXPORT_FORMATS:
+        return f'Error: format must be one of {", ".join(EXPORT_FORMATS)}\n', 400
+    if profile not in EXPORT_PROFILES:
+        return f'Error: profile must be one of {", ".join(EXPORT_PROFILES)}\n', 400
+    try:
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (TypeError, ValueError):
+        return 'Error: Invalid from or to value\n', 400
+    plant_ids = [plant_id for plant_id in request.args.get('plant_id', '').split(',') if plant_id]
+    documents = export_documents(plant_data_reader, plant_ids, start, end, batch_size=PLANT_DATA_EXPORT_BATCH_SIZE)
+    try:
+        chunks = export_chunks(documents, export_format, profile, batch_size=PLANT_DATA_EXPORT_BATCH_SIZE)
+    except RuntimeError as e:
+        return f'Error: {e}\n', 501
+    logger.info('[PLANT_DATA][EXPORT] Exporting %s as %s (%s)', ','.join(plant_ids) or 'all plants', export_format, profile)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=plant_data_{int(time.time())}.{extension}'
+    return response, 200
+
+
+@api.route('/plant_data/<plant_id>/rollup', methods=['GET'])
+def plant_data_rollup_handler(plant_id):
+    # Query params: interval (1h o 1d), from, to
+    interval = request.args.get('interval', '1h')
+    if interval not in ROLLUP_INTERVALS:
+        return f'Error: interval must be one of {", ".join(ROLLUP_INTERVALS)}\n', 400
+    try:
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (TypeError, ValueError):
+        return 'Error: Invalid from or to value\n', 400
+    rollups = rollup_store.query(plant_id, interval, start, end)
+    logger.debug('[PLANT_DATA][ROLLUP] Plant: %s interval %s, sending %d rollups', plant_id, interval, len(rollups))
+    return jsonify(rollups), 200
+
+@api.route('/metrics', methods=['GET'])
+def metrics_handler():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type), 200
+
+@api.route('/scheduler_lag', methods=['GET'])
+def scheduler_lag_handler():
+    return jsonify(job_lag_tracker.stats()), 200
+
+@api.route('/cluster', methods=['GET'])
+def cluster_handler():
+    return jsonify({'scheduler_owner': scheduler_lock.held, **node_cluster.stats()}), 200
+
+@api.route('/device_poller', methods=['GET'])
+def device_poller_handler():
+    return jsonify(device_poller.stats()), 200
+
+@api.route('/listing_cache', methods=['GET'])
+def listing_cache_handler():
+    return jsonify(listing_cache.stats()), 200
+
+@api.route('/archive', methods=['GET'])
+def archive_handler():
+    enabled = ARCHIVE_AFTER_DAYS > 0 and plant_data_store.can_delete_readings()
+    return jsonify({'enabled': enabled, 'after_days': ARCHIVE_AFTER_DAYS, **cold_archive.stats()}), 200
+
+@api.route('/ingest_buffer', methods=['GET'])
+def ingest_buffer_handler():
+    if ingest_buffer is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({'enabled': True, **ingest_buffer.stats()}), 200
+
+@api.route('/plant_data/batch', methods=['POST'])
+def plant_data_batch_handler():
+    """Recibe una lista de lecturas (de una o varias plantas) y las guarda con un solo insert_many"""
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if not isinstance(data, list):
+        return jsonify({'success': False, 'message': 'Error: Expected a list of readings'}), 400
+    if len(data) > PLANT_DATA_BATCH_MAX_SIZE:
+        return jsonify({'success': False, 'message': f'Error: Batch exceeds {PLANT_DATA_BATCH_MAX_SIZE} readings'}), 413
+
+    validator = validator_for(ESP8266_sensor_data_schema)(ESP8266_sensor_data_schema)
+    unix_timestamp = int(time.time())
+    documents = []
+    document_index = [] # Posicion en la lista original de cada documento a insertar
+    errors = []
+    for index, reading in enumerate(data):
+        if not isinstance(reading, dict):
+            errors.append({'index': index, 'errors': ['Reading must be a JSON object']})
+            continue
+        item_errors = [error.message for error in validator.iter_errors(reading)]
+        if not item_errors:
+            if not isinstance(reading.get('plant_id'), str):
+                item_errors.append("'plant_id' is a required string property")
+            # Las lecturas pueden traer su propio timestamp (importaciones, lecturas guardadas en el dispositivo)
+            # Un timestamp null se rechaza en lugar de guardarse (rompe los rollups y el orden de las consultas)
+            if 'timestamp' in reading and not (valid_timestamp(reading['timestamp']) and reading['timestamp'] > 0):
+                item_errors.append(f"'timestamp' must be a positive integer unix timestamp up to {MAX_TIMESTAMP}")
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+            continue
+        documents.append(sensor_data_document(reading, reading.get('timestamp', unix_timestamp)))
+        document_index.append(index)
+
+    inserted, write_errors = plant_data_store.insert_many(documents)
+    for write_error in write_errors:
+        errors.append({'index': document_index[write_error['index']], 'errors': [write_error['errmsg']]})
+    errors.sort(key=lambda error: error['index'])
+
+    logger.info('[PLANT_DATA][BATCH] Recieved %d readings, inserted: %d, rejected: %d', len(data), inserted, len(errors))
+    return jsonify({'success': not errors, 'inserted': inserted, 'errors': errors}), 200 if not errors else 207
+
+
+@api.route('/plant_data', methods=['POST', 'GET', 'DELETE'])
 @schema.validate(ESP8266_sensor_data_schema)
 def plant_data_handler():
     if request.method == 'POST':
         data = request.json
         unix_timestamp = int(time.time())
-        print(f'[PLANT_DATA][POST] Recieved Plant data')
-        print("\tPlant_ID: " + data.get('plant_id'))
-        print("\tSensor Number: " + data.get('sensor_num'))
-        print("\tTimestamp: " + str(unix_timestamp))
-        print("\tTemperature: " + data.get('temp'))
-        print("\tRelative Humidity: " + data.get('rel_hum'))
-        print("\tLux: " + data.get('lux'))
-        print("\tMoisture ADC Value: " + data.get('moi_ana'))
-        plant_data_collection.insert_one(
-            {
-                'plant_id': data.get('plant_id'),
-                "timestamp": unix_timestamp,
-                "temperature": data.get('temp'),
-                "relative_humidity": data.get('rel_hum'),
-                "lux": data.get('lux'),
-                "moisture_value": data.get('moi_ana'),
-                "sensor_num": data.get('sensor_num')
-            }
-        )
+        logger.debug('[PLANT_DATA][POST] Recieved Plant data: plant_id %s, sensor %s, timestamp %d, temperature %s, relative humidity %s, lux %s, moisture ADC %s',
+                     data.get('plant_id'), data.get('sensor_num'), unix_timestamp, data.get('temp'), data.get('rel_hum'), data.get('lux'), data.get('moi_ana'))
+        document = sensor_data_document(data, unix_timestamp)
+        # Si la cola esta llena se escribe directo para no perder la lectura
+        if ingest_buffer is not None and ingest_buffer.put(document):
+            return jsonify({ 'success': True, 'message': 'Queued for DB' }), 202
+        plant_data_store.insert_one(document)
         return jsonify({ 'success': True, 'message': 'Added to DB' }), 200
     elif request.method == 'GET':
         if not request.data:
-            print(f'[PLANT_DATA][GET] All Plant data list request')
-            plant_data = list(plant_data_collection.find({}, {'_id': 0}))
-            print(f'[PLANT_DATA][GET] Total Plant data sent: {len(plant_data)}\n')
+            logger.debug('[PLANT_DATA][GET] All Plant data list request')
+            if wants_stream():
+                logger.debug('[PLANT_DATA][GET] Streaming all Plant data')
+                return ndjson_response(plant_data_reader.find(batch_size=PLANT_DATA_STREAM_BATCH_SIZE)), 200
+            plant_data = list(plant_data_reader.find())
+            for doc in plant_data:
+                del doc['_id']
+            logger.debug('[PLANT_DATA][GET] Total Plant data sent: %d', len(plant_data))
             return jsonify(plant_data), 200
         else:
             data = request.json 
             if data.get('plant_id'):
                 plant_id = data.get('plant_id')
-                if data.get('dates'):
-                    # [TODO]: implement a date query method
-                    return 'Not implemented yet', 501
-                print(f'[PLANT_DATA][GET] Plant: {plant_id} data request')
-                plant_data = list(plant_data_collection.find({'plant_id': plant_id}, {'_id': 0}))
-                # print(plant_data)
-                if not any(plant_data):
-                    return 'Error: Plant ID Not Found\n', 404
-                return jsonify(plant_data), 200
+                # dates: {"from": ..., "to": ...}
+                dates = data.get('dates') or {}
+                logger.debug('[PLANT_DATA][GET] Plant: %s data request', plant_id)
+                return plant_data_response(plant_id,
+                                                dates.get('from'),
+                                                dates.get('to'),
+                                                data.get('limit'),
+                                                data.get('cursor'))
             else:
                 return 'Error: Plant ID not provided\n', 404
     elif request.method == 'DELETE':
@@ -490,8 +991,11 @@ def plant_data_handler():
             data = request.json
             if data.get('plant_id'):
                 plant_id = data.get('plant_id')
-                deleted_plant_data = plant_data_collection.delete_many({'plant_id': plant_id})
-                if deleted_plant_data.deleted_count:
+                deleted_plant_data = plant_data_store.delete_plant(plant_id)
+                deleted_plant_data += cold_archive.delete_plant(plant_id)
+                rollup_store.delete_plant(plant_id)
+                latest_readings.forget(plant_id)
+                if deleted_plant_data:
                     return f'Plant data from plant id {plant_id} Deleted Successfully\n', 200
                 return f'Plant data from plant ID {plant_id} NOT found\n', 404
         return 'Error: No ID provided\n', 404
@@ -500,8 +1004,5 @@ def plant_data_handler():
 
 
 if __name__ == '__main__':
-    scheduler.api_enabled = True
-    scheduler.init_app(app)
-    load_scheduler_jobs_at_startup()
-    scheduler.start()
-    app.run(debug=False, host=ip, port=2000, use_reloader=False)
\ No newline at end of file
+    # Servidor de desarrollo de Flask, un solo proceso. En produccion: gunicorn -c gunicorn.conf.py wsgi:app
+    create_app().run(debug=False, host=ip, port=2000, use_reloader=False)
@@ -0,0 +1,374 @@
+"""Archivo de lecturas viejas en segmentos comprimidos en disco (cold) y lectura combinada con Mongo (hot).
+
+El archivador mueve las lecturas con mas de ARCHIVE_AFTER_DAYS a un segmento por planta
+por mes. Un segmento son dos archivos:
+
+- `<mes>.data`: bloques de hasta `batch_size` lecturas, cada uno un JSON con gzip
+  organizado por columnas (_id, timestamp, sensor_num y un arreglo por campo del sensor)
+  y ordenado por (timestamp, _id). Los bloques nuevos se agregan al final del archivo.
+- `<mes>.blocks.json`: posicion, tamano y rango de tiempo de cada bloque, para leer solo
+  los bloques de una consulta sin descomprimir el resto.
+
+El indice `index.json` guarda por planta sus meses y `archived_before`: las lecturas con
+timestamp menor estan en disco y las demas en Mongo.
+
+Orden de cada lote: se agrega el bloque, se actualiza el indice y al final se borran de
+Mongo los _id del lote. Si el proceso muere a la mitad las lecturas quedan en los dos
+lados; las consultas no las duplican porque usan `archived_before` para decidir de donde
+leer, y el siguiente archivado no las vuelve a escribir (se comparan por _id) y termina
+de borrarlas. Cada lote y cada borrado de planta toma un flock sobre `archive.lock`, asi
+que el job del scheduler, manage.py archive y los workers que atienden DELETE /plant_data
+no se pisan el indice ni los segmentos.
+
+Los segmentos se escriben en el disco del nodo que corre el scheduler. Con varios nodos
+ARCHIVE_DIR debe ser un directorio compartido para que todos lean las mismas lecturas.
+"""
+import calendar
+import contextlib
+import fcntl
+import gzip
+import heapq
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from bson import ObjectId
+
+from plant_data_store import after_cursor
+from readings import SENSOR_VALUE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'archive.lock'
+
+
+def next_month(timestamp):
+    date = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    year, month = (date.year + 1, 1) if date.month == 12 else (date.year, date.month + 1)
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+
+def month_key(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m')
+
+
+def reading_key(doc):
+    return doc['timestamp'], doc['_id']
+
+
+def write_json_atomic(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temporary, path)
+
+
+def overlapping_groups(blocks):
+    """Agrupa los bloques por rango de tiempo: los de un grupo se traslapan y los grupos van en orden"""
+    group, group_end = [], None
+    for block in sorted(blocks, key=lambda block: (block['start'], block['end'])):
+        if group and block['start'] > group_end:
+            yield group
+            group = []
+        group_end = block['end'] if not group else max(group_end, block['end'])
+        group.append(block)
+    if group:
+        yield group
+
+
+class ColdArchive:
+
+    def __init__(self, directory, batch_size=10000):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self._index = {'plants': {}}
+        self._index_version = None
+        # Solo los metadatos de los bloques; los datos se leen del disco en cada consulta
+        self._block_cache = {}
+        self._lock = threading.Lock()
+        # Solo un archivado a la vez en el proceso; entre procesos los cambios se serializan con `_locked`
+        self._archive_lock = threading.Lock()
+        self._last_run = None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """flock exclusivo sobre ARCHIVE_DIR/archive.lock mientras se modifican segmentos, indice y Mongo.
+
+        Lo comparten los workers de gunicorn (DELETE /plant_data) y manage.py archive, que son
+        procesos distintos; el sistema operativo lo libera si el proceso muere.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _plants(self):
+        """Entradas del indice por planta; se recarga si otro proceso lo reescribio"""
+        try:
+            stat = os.stat(self.index_path)
+            # Cada escritura reemplaza el archivo (os.replace), asi que el inodo cambia aunque el mtime sea el mismo
+            version = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            if version != self._index_version:
+                with open(self.index_path, encoding='utf-8') as f:
+                    self._index = json.load(f)
+                self._index_version = version
+            return self._index['plants']
+
+    def _save_index(self, plants):
+        os.makedirs(self.directory, exist_ok=True)
+        write_json_atomic(self.index_path, {'plants': plants})
+
+    def _plant_directory(self, plant_id):
+        # El prefijo evita nombres como '..'; quote escapa '/'
+        return os.path.join(self.directory, f"plant_{quote(str(plant_id), safe='')}")
+
+    def _segment_paths(self, plant_id, key):
+        base = os.path.join(self._plant_directory(plant_id), key)
+        return f'{base}.data', f'{base}.blocks.json'
+
+    def _segment_blocks(self, plant_id, key):
+        """Bloques de un segmento; se recargan si otro proceso los reescribio"""
+        _, blocks_path = self._segment_paths(plant_id, key)
+        try:
+            stat = os.stat(blocks_path)
+            version = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            cached = self._block_cache.get(blocks_path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        with open(blocks_path, encoding='utf-8') as f:
+            blocks = json.load(f)['blocks']
+        with self._lock:
+            self._block_cache[blocks_path] = (version, blocks)
+        return blocks
+
+    @staticmethod
+    def _read_block(data_path, block):
+        with open(data_path, 'rb') as f:
+            f.seek(block['offset'])
+            return json.loads(gzip.decompress(f.read(block['length'])))
+
+    def archived_before(self, plant_id):
+        return self._plants().get(plant_id, {}).get('archived_before')
+
+    def watermarks(self):
+        return {plant_id: entry['archived_before'] for plant_id, entry in self._plants().items()}
+
+    def find(self, plant_id=None, start=None, end=None, after=None):
+        """Lecturas archivadas en [start, end]; por planta en orden (timestamp, _id), como plant_data_store.find"""
+        plants = self._plants()
+        plant_ids = [plant_id] if plant_id is not None else list(plants)
+        for current_plant in plant_ids:
+            entry = plants.get(current_plant)
+            if entry is None:
+                continue
+            for key in sorted(entry['segments']):
+                yield from self._segment_readings(current_plant, key, start, end, after)
+
+    def _segment_readings(self, plant_id, key, start, end, after):
+        data_path, _ = self._segment_paths(plant_id, key)
+        blocks = [block for block in self._segment_blocks(plant_id, key)
+                  if not ((start is not None and block['end'] < start)
+                          or (end is not None and block['start'] > end)
+                          or (after is not None and block['end'] < after[0]))]
+        for group in overlapping_groups(blocks):
+            readings = [self._block_readings(plant_id, data_path, block, start, end, after) for block in group]
+            # Los bloques de lecturas que llegaron tarde se traslapan con los anteriores
+            yield from readings[0] if len(readings) == 1 else heapq.merge(*readings, key=reading_key)
+
+    def _block_readings(self, plant_id, data_path, block, start, end, after):
+        columns = self._read_block(data_path, block)
+        for row, timestamp in enumerate(columns['timestamp']):
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp > end:
+                break
+            doc = {'_id': ObjectId(columns['_id'][row]), 'plant_id': plant_id, 'timestamp': timestamp}
+            if not after_cursor(doc, after):
+                continue
+            for field in SENSOR_VALUE_FIELDS:
+                doc[field] = columns[field][row]
+            doc['sensor_num'] = columns['sensor_num'][row]
+            yield doc
+
+    def _append_block(self, plant_id, readings):
+        """Agrega un bloque con las lecturas (de un mes, en orden) que no esten ya en el segmento; regresa cuantas escribio"""
+        key = month_key(readings[0]['timestamp'])
+        data_path, blocks_path = self._segment_paths(plant_id, key)
+        blocks = list(self._segment_blocks(plant_id, key))
+        # Lecturas de un archivado anterior que no alcanzo a borrarlas de Mongo
+        archived_ids = set()
+        for block in blocks:
+            if block['start'] <= readings[-1]['timestamp'] and block['end'] >= readings[0]['timestamp']:
+                archived_ids.update(self._read_block(data_path, block)['_id'])
+        readings = [doc for doc in readings if str(doc['_id']) not in archived_ids]
+        if not readings:
+            return 0
+
+        columns = {'_id': [str(doc['_id']) for doc in readings],
+                   'timestamp': [doc['timestamp'] for doc in readings],
+                   'sensor_num': [doc.get('sensor_num') for doc in readings]}
+        for field in SENSOR_VALUE_FIELDS:
+            columns[field] = [doc.get(field) for doc in readings]
+        data = gzip.compress(json.dumps(columns, separators=(',', ':')).encode('utf-8'))
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        # Si el proceso muere antes de guardar los bloques, los bytes al final del archivo quedan sin usar
+        with open(data_path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+        blocks.append({'offset': offset, 'length': len(data), 'start': readings[0]['timestamp'],
+                       'end': readings[-1]['timestamp'], 'count': len(readings)})
+        write_json_atomic(blocks_path, {'blocks': blocks})
+        return len(readings)
+
+    def _archive_batch(self, store, plant_id, readings, archived_before, totals):
+        # Bloque, indice y borrado bajo el lock: otro proceso no puede reescribir el indice en medio
+        with self._locked():
+            totals['archived'] += self._append_block(plant_id, readings)
+            plants = json.loads(json.dumps(self._plants()))
+            entry = plants.setdefault(plant_id, {'archived_before': None, 'segments': []})
+            key = month_key(readings[0]['timestamp'])
+            if key not in entry['segments']:
+                entry['segments'] = sorted(entry['segments'] + [key])
+            entry['archived_before'] = max(archived_before, entry['archived_before'] or 0)
+            self._save_index(plants)
+            # Todas las lecturas del lote estan en disco (de este lote o de uno anterior); se pueden borrar de Mongo
+            try:
+                totals['deleted'] += store.delete_readings(plant_id, readings)
+            except Exception:
+                logger.exception('Could not delete archived readings of plant %s from Mongo, they will be deleted on the next run', plant_id)
+
+    def archive(self, store, cutoff):
+        """Mueve a disco las lecturas con timestamp < cutoff; regresa {'archived', 'deleted', 'plants'}.
+
+        Las lecturas de cada planta se leen en orden y se archivan en lotes de `batch_size`
+        (un lote no parte un mes ni un mismo timestamp), asi que la memoria no depende de
+        cuantas lecturas haya. `cutoff` se redondea al inicio del dia (UTC).
+        """
+        if not store.can_delete_readings():
+            raise RuntimeError(f'The {store.layout} layout cannot delete archived readings on this MongoDB server '
+                               f'(needs MongoDB 7.0), archiving is disabled')
+        cutoff -= cutoff % 86400
+        totals = {'archived': 0, 'deleted': 0, 'plants': 0}
+        with self._archive_lock:
+            begin = time.time()
+            for plant_id in store.plant_ids():
+                batch, batch_month_end = [], None
+                for doc in store.find(plant_id, end=cutoff - 1, batch_size=self.batch_size):
+                    if batch and (doc['timestamp'] >= batch_month_end
+                                  or (len(batch) >= self.batch_size and doc['timestamp'] != batch[-1]['timestamp'])):
+                        # Todas las lecturas anteriores a doc ya estan en el lote
+                        self._archive_batch(store, plant_id, batch, doc['timestamp'], totals)
+                        batch = []
+                    if not batch:
+                        batch_month_end = next_month(doc['timestamp'])
+                    batch.append(doc)
+                if batch:
+                    self._archive_batch(store, plant_id, batch, cutoff, totals)
+                    totals['plants'] += 1
+            self._last_run = {'finished': int(time.time()), 'cutoff': cutoff, 'duration_s': round(time.time() - begin, 3), **totals}
+        if totals['plants']:
+            logger.info('Archived %d readings of %d plants older than %s, deleted %d from Mongo',
+                        totals['archived'], totals['plants'], month_key(cutoff), totals['deleted'])
+        return totals
+
+    def delete_plant(self, plant_id):
+        with self._locked():
+            plants = json.loads(json.dumps(self._plants()))
+            entry = plants.pop(plant_id, None)
+            if entry is None:
+                return 0
+            deleted = sum(block['count'] for key in entry['segments'] for block in self._segment_blocks(plant_id, key))
+            self._save_index(plants)
+            shutil.rmtree(self._plant_directory(plant_id), ignore_errors=True)
+            return deleted
+
+    def stats(self):
+        plants = self._plants()
+        segments = blocks = readings = size = 0
+        for plant_id, entry in plants.items():
+            for key in entry['segments']:
+                segment_blocks = self._segment_blocks(plant_id, key)
+                segments += 1
+                blocks += len(segment_blocks)
+                readings += sum(block['count'] for block in segment_blocks)
+                try:
+                    size += os.path.getsize(self._segment_paths(plant_id, key)[0])
+                except OSError:
+                    pass
+        return {
+            'directory': self.directory,
+            'batch_size': self.batch_size,
+            'plants': len(plants),
+            'segments': segments,
+            'blocks': blocks,
+            'readings': readings,
+            'bytes': size,
+            'last_run': self._last_run,
+        }
+
+
+class TieredPlantData:
+    """Lecturas de Mongo (plant_data_store) y del archivo en disco con la interfaz de `find` del store.
+
+    Por planta primero van las lecturas archivadas (timestamp < archived_before) y despues
+    las de Mongo desde archived_before, asi que el orden (timestamp, _id) y los cursores de
+    paginacion funcionan igual que con el store solo.
+    """
+
+    def __init__(self, store, archive):
+        self.store = store
+        self.archive = archive
+
+    def find(self, plant_id=None, start=None, end=None, after=None, limit=None, batch_size=None):
+        if plant_id is None:
+            yield from self._find_all(start, end, limit, batch_size)
+            return
+        yielded = 0
+        archived_before = self.archive.archived_before(plant_id)
+        hot_start = start
+        if archived_before is not None:
+            if start is None or start < archived_before:
+                cold_end = archived_before - 1 if end is None else min(end, archived_before - 1)
+                for doc in self.archive.find(plant_id, start, cold_end, after):
+                    yield doc
+                    yielded += 1
+                    if limit and yielded >= limit:
+                        return
+            hot_start = archived_before if start is None else max(start, archived_before)
+            if end is not None and hot_start > end:
+                return
+        yield from self.store.find(plant_id, hot_start, end, after, limit=limit - yielded if limit else None, batch_size=batch_size)
+
+    def _find_all(self, start, end, limit, batch_size):
+        yielded = 0
+        for doc in self.archive.find(None, start, end):
+            yield doc
+            yielded += 1
+            if limit and yielded >= limit:
+                return
+        watermarks = self.archive.watermarks()
+        for doc in self.store.find(start=start, end=end, batch_size=batch_size):
+            # Lecturas ya archivadas que todavia no se borran de Mongo
+            if doc['timestamp'] < (watermarks.get(doc['plant_id']) or 0):
+                continue
+            yield doc
+            yielded += 1
+            if limit and yielded >= limit:
+                return
@@ -0,0 +1,117 @@
+"""Reparto de dispositivos entre varios nodos del backend que comparten la misma base de datos.
+
+Cada nodo (el proceso con el scheduler, ver scheduler_lock.py) renueva un lease en la
+coleccion `nodes`. Con los nodos vivos se arma un anillo de hashing consistente y cada
+dispositivo (por MAC) le toca al nodo que sigue a su hash en el anillo; cuando un nodo
+entra o su lease vence solo cambian de dueno los dispositivos de ese nodo.
+
+Para no consultar dos veces un dispositivo mientras los nodos ven anillos distintos,
+cada dispositivo tambien tiene un lease en `device_leases`: un nodo solo agrega los
+jobs de un dispositivo despues de tomar su lease, y el dueno anterior lo suelta cuando
+ya quito sus jobs (o el lease vence si el nodo murio). Los vencimientos usan el reloj
+de cada nodo, asi que los relojes deben estar sincronizados (NTP) con un margen mucho
+menor que `lease_seconds`.
+
+    {'_id': node_id, 'expires_at': datetime, 'host': str, 'pid': int}    # nodes
+    {'_id': device_mac, 'owner': node_id, 'expires_at': datetime}        # device_leases
+"""
+import bisect
+import os
+import socket
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+
+def ring_hash(key):
+    return zlib.crc32(key.encode('utf-8'))
+
+
+class NodeCluster:
+
+    # Puntos de cada nodo en el anillo; con mas puntos el reparto es mas parejo
+    VIRTUAL_NODES = 64
+
+    def __init__(self, node_collection, lease_collection, node_id, lease_seconds=90):
+        self.node_collection = node_collection
+        self.lease_collection = lease_collection
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self._owned = set()
+        self._nodes = []
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        # Mongo borra los leases vencidos; las consultas igual filtran por expires_at
+        self.node_collection.create_index([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0)
+        self.lease_collection.create_index([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0)
+        self.lease_collection.create_index([('owner', ASCENDING)], name='owner')
+
+    def heartbeat(self):
+        now = datetime.now(timezone.utc)
+        self.node_collection.update_one({'_id': self.node_id},
+                                        {'$set': {'expires_at': now + timedelta(seconds=self.lease_seconds),
+                                                  'host': socket.gethostname(),
+                                                  'pid': os.getpid()}},
+                                        upsert=True)
+
+    def live_nodes(self):
+        now = datetime.now(timezone.utc)
+        return sorted(doc['_id'] for doc in self.node_collection.find({'expires_at': {'$gt': now}}, {'_id': 1}))
+
+    def assign(self, device_macs):
+        """Renueva el lease del nodo y regresa las MAC de `device_macs` que este nodo debe consultar.
+
+        Solo se regresan dispositivos cuyo lease tiene este nodo; uno que todavia tiene
+        otro nodo se toma en una llamada posterior, cuando lo suelte o venza su lease.
+        Los leases que ya no le tocan al nodo se sueltan con `release`.
+        """
+        self.heartbeat()
+        nodes = self.live_nodes()
+        if self.node_id not in nodes:
+            nodes = sorted([*nodes, self.node_id])
+        ring = sorted((ring_hash(f'{node}#{index}'), node) for node in nodes for index in range(self.VIRTUAL_NODES))
+        points = [point for point, _ in ring]
+        assigned = set()
+        for mac in device_macs:
+            position = bisect.bisect(points, ring_hash(mac)) % len(ring)
+            if ring[position][1] == self.node_id:
+                assigned.add(mac)
+
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+        self.lease_collection.update_many({'owner': self.node_id, '_id': {'$in': list(assigned)}},
+                                          {'$set': {'expires_at': expires_at}})
+        held = {doc['_id'] for doc in self.lease_collection.find({'owner': self.node_id, '_id': {'$in': list(assigned)}}, {'_id': 1})}
+        for mac in assigned - held:
+            try:
+                self.lease_collection.update_one({'_id': mac, '$or': [{'owner': self.node_id}, {'expires_at': {'$lte': datetime.now(timezone.utc)}}]},
+                                                 {'$set': {'owner': self.node_id, 'expires_at': expires_at}},
+                                                 upsert=True)
+                held.add(mac)
+            except DuplicateKeyError:
+                pass # Lo tiene otro nodo con un lease vigente
+
+        with self._lock:
+            self._owned = held
+            self._nodes = nodes
+        return set(held)
+
+    def release(self, keep=()):
+        """Suelta los leases de dispositivos de este nodo que no estan en `keep`"""
+        self.lease_collection.delete_many({'owner': self.node_id, '_id': {'$nin': list(keep)}})
+
+    def owns(self, device_mac):
+        with self._lock:
+            return device_mac in self._owned
+
+    def leave(self):
+        """Al apagar: borra el lease del nodo y suelta sus dispositivos para que otro nodo los tome"""
+        self.release()
+        self.node_collection.delete_one({'_id': self.node_id})
+
+    def stats(self):
+        with self._lock:
+            return {'node_id': self.node_id, 'live_nodes': list(self._nodes), 'owned_devices': sorted(self._owned)}
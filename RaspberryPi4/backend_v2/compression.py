@@ -0,0 +1,146 @@
+"""Compresion de respuestas negociada con Accept-Encoding.
+
+gzip siempre esta disponible (zlib). zstd y br se ofrecen solo si estan instalados
+`zstandard` o `brotli` (pip install zstandard brotli); si el cliente acepta varias con la
+misma calidad se prefiere zstd, despues br y despues gzip.
+
+Las respuestas normales se comprimen completas si miden al menos `min_bytes`. Las
+respuestas en streaming (NDJSON de /plant_data) se comprimen chunk por chunk con un flush
+despues de cada uno, asi que el cliente recibe cada lote sin esperar al final.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+
+class GzipEncoder:
+
+    def __init__(self, level):
+        # wbits 31: formato gzip (encabezado y CRC) en lugar de zlib
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class ZstdEncoder:
+
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# (encoding, clase, nivel) en orden de preferencia del servidor. Niveles bajos: el Pi comprime cada respuesta
+AVAILABLE_ENCODERS = [(encoding, encoder, level) for encoding, encoder, level, module in (
+    ('zstd', ZstdEncoder, 3, zstandard),
+    ('br', BrotliEncoder, 4, brotli),
+    ('gzip', GzipEncoder, 6, zlib),
+) if module is not None]
+
+
+def compressed_chunks(chunks, encoder):
+    """Comprime un iterable de chunks; cada chunk se manda en cuanto se comprime"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        # Cierra el generador original (p. ej. el cursor de Mongo de ndjson_response)
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class ResponseCompressor:
+
+    def __init__(self, min_bytes=1024, encodings=None):
+        self.min_bytes = min_bytes
+        self.encoders = [entry for entry in AVAILABLE_ENCODERS if encodings is None or entry[0] in encodings]
+
+    @property
+    def encodings(self):
+        return [encoding for encoding, _, _ in self.encoders]
+
+    def encoded_etags(self, etag):
+        """ETags con que un cliente puede revalidar `etag`: el original y el de cada encoding"""
+        return [etag, *(f'{etag}-{encoding}' for encoding in self.encodings)]
+
+    def negotiate(self, request):
+        encoding = request.accept_encodings.best_match(self.encodings)
+        for name, encoder, level in self.encoders:
+            if name == encoding:
+                return name, encoder(level)
+        return None, None
+
+    def compress(self, request, response):
+        """after_request: comprime la respuesta si el cliente lo acepta y vale la pena"""
+        if (response.direct_passthrough
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        if not response.is_streamed and (response.content_length or 0) < self.min_bytes:
+            return response
+        encoding, encoder = self.negotiate(request)
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compressed_chunks(response.response, encoder)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            compressed = encoder.compress(data) + encoder.finish()
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # El ETag fuerte identifica bytes exactos, y los bytes comprimidos son otros
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
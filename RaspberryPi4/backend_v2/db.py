@@ -0,0 +1,102 @@
+import logging
+import os
+from dotenv import load_dotenv, find_dotenv
+
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+from pymongo.errors import ConnectionFailure
+
+from metrics import MongoCommandListener, record_readings
+from plant_data_store import create_plant_data_store
+from rollups import RollupStore
+from archive import ColdArchive, TieredPlantData
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+MONGO_DB_LOCAL_USER = os.environ.get("MONGO_DB_LOCAL_USER")
+MONGO_DB_LOCAL_PWD = os.environ.get("MONGO_DB_LOCAL_PWD")
+MONGO_DB_LOCAL_IP = os.environ.get("MONGO_DB_LOCAL_IP")
+MONGO_DB_LOCAL_PORT = os.environ.get("MONGO_DB_LOCAL_PORT")
+# Database name; benchmarks and synthetic data can point to a separate one
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "ver_2bd")
+# Use an in-memory mongomock database instead of a mongod (benchmarks, local runs). Needs: pip install mongomock
+MONGO_DB_MOCK = os.environ.get("MONGO_DB_MOCK", "0") == "1"
+# Storage layout for plant readings: auto, timeseries, bucket or flat (see plant_data_store.py)
+# mongomock has no time-series collections, so the mock defaults to flat
+PLANT_DATA_LAYOUT = os.environ.get("PLANT_DATA_LAYOUT", "flat" if MONGO_DB_MOCK else "auto")
+# Directory for archived (cold) readings, see archive.py. Must be shared between nodes when running several
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+# Readings read, written and deleted per archive step; the archiver's memory use grows with it
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 10000))
+
+# URI for the cluster. Remember to have an .env file with user, password and DB name for the local Mongo DB instance
+uri = f"mongodb://{MONGO_DB_LOCAL_USER}:{MONGO_DB_LOCAL_PWD}@{MONGO_DB_LOCAL_IP}:{MONGO_DB_LOCAL_PORT}"
+
+if MONGO_DB_MOCK:
+    import mongomock
+    logger.warning('MONGO_DB_MOCK is set, using an in-memory mongomock database. Data is lost on exit')
+    client = mongomock.MongoClient()
+else:
+    # # Attempt to connect to local Mongo database
+    logger.info('Attempting to connect to MongoDB on %s:%s', MONGO_DB_LOCAL_IP, MONGO_DB_LOCAL_PORT)
+    try:
+        client = MongoClient(uri,
+                             server_api=ServerApi('1'),
+                             serverSelectionTimeoutMS=5000,
+                             connectTimeoutMS=5000,
+                             socketTimeoutMS=5000, 
+                             uuidRepresentation='standard',
+                             event_listeners=[MongoCommandListener()]
+                             )
+        client.admin.command('ping')
+    except ConnectionFailure as e:
+        logger.error('Could not connect to mongoDB database %s', e)
+
+# Define database or create database if not exists
+
+plant_db = client[MONGO_DB_NAME]
+
+# Define collection or create collection if not exists
+plant_collection = plant_db["plants"]
+device_collection = plant_db["devices"]
+garden_collection = plant_db["gardens"]
+# Legacy one-document-per-reading collection, read and written through plant_data_store only with the flat layout
+plant_data_collection = plant_db["plant_data"]
+# Progress of maintenance commands (manage.py)
+migration_collection = plant_db["migrations"]
+# Backend node leases and device ownership when several nodes share this database (cluster.py)
+node_collection = plant_db["nodes"]
+device_lease_collection = plant_db["device_leases"]
+# Version counters of the cached /plant, /device and /garden listings (listing_cache.py)
+collection_versions = plant_db["collection_versions"]
+
+# Progress of "manage.py copy-layout" in migration_collection
+COPY_LAYOUT_ID = 'plant_data_copy_layout'
+
+def legacy_copy_pending(layout):
+    """True si la coleccion plant_data tiene lecturas que copy-layout no ha terminado de copiar a `layout`"""
+    if layout == 'flat' or plant_data_collection.find_one({}, {'_id': 1}) is None:
+        return False
+    progress = migration_collection.find_one({'_id': COPY_LAYOUT_ID}) or {}
+    return not (progress.get('finished') and progress.get('layout') == layout)
+
+# All reads and writes of plant readings go through this store
+plant_data_store = create_plant_data_store(plant_db, PLANT_DATA_LAYOUT)
+# With layout auto an existing plant_data history keeps the flat layout until copy-layout has copied it,
+# so upgrading does not hide it. An explicit PLANT_DATA_LAYOUT is always used as is
+if PLANT_DATA_LAYOUT == 'auto' and legacy_copy_pending(plant_data_store.layout):
+    logger.warning('Readings found in the legacy plant_data collection, using the flat layout until they are copied. '
+                   'Run "python manage.py copy-layout" and restart to switch to the %s layout', plant_data_store.layout)
+    plant_data_store = create_plant_data_store(plant_db, 'flat')
+
+# Hourly/daily aggregates, updated on every insert into the store
+rollup_store = RollupStore(plant_db)
+plant_data_store.add_listener(rollup_store.record)
+plant_data_store.add_listener(record_readings)
+
+# Readings older than ARCHIVE_AFTER_DAYS live in compressed segments on disk; range queries read
+# through plant_data_reader, which combines them with the store
+cold_archive = ColdArchive(ARCHIVE_DIR, batch_size=ARCHIVE_BATCH_SIZE)
+plant_data_reader = TieredPlantData(plant_data_store, cold_archive)
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from io import BytesIO
+
+import pycurl
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceClient:
+    """Cliente HTTP para los dispositivos (ESP8266) con timeouts acotados.
+
+    Mantiene un pool de handles de pycurl por dispositivo. `reset()` limpia las opciones
+    pero conserva las conexiones abiertas del handle, asi que el keep-alive funciona con
+    los dispositivos que no cierran el socket despues de cada respuesta. Los resultados
+    de `ping` se guardan unos segundos para que un dispositivo apagado no bloquee cada
+    request que lo consulta.
+    """
+
+    def __init__(self, connect_timeout_ms=2000, total_timeout_ms=5000, max_idle_per_device=2,
+                 ping_cache_seconds=30, ping_failure_cache_seconds=5):
+        self.connect_timeout_ms = connect_timeout_ms
+        self.total_timeout_ms = total_timeout_ms
+        self.max_idle_per_device = max_idle_per_device
+        self.ping_cache_seconds = ping_cache_seconds
+        self.ping_failure_cache_seconds = ping_failure_cache_seconds
+        self._idle = {} # device_ip -> [handles libres]
+        self._ping_cache = {} # device_ip -> (resultado, expira)
+        self._lock = threading.Lock()
+
+    def acquire(self, device_ip):
+        """Regresa un handle listo para configurar, reutilizado del pool si hay uno libre"""
+        with self._lock:
+            idle = self._idle.get(device_ip)
+            handle = idle.pop() if idle else None
+        if handle is None:
+            handle = pycurl.Curl()
+        else:
+            handle.reset()
+        handle.setopt(pycurl.CONNECTTIMEOUT_MS, self.connect_timeout_ms)
+        handle.setopt(pycurl.TIMEOUT_MS, self.total_timeout_ms)
+        handle.setopt(pycurl.NOSIGNAL, 1)
+        return handle
+
+    def release(self, device_ip, handle, reusable=True):
+        """Regresa un handle al pool; se cierra si hubo error o el pool esta lleno"""
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(device_ip, [])
+                if len(idle) < self.max_idle_per_device:
+                    idle.append(handle)
+                    return
+        handle.close()
+
+    def ping(self, device_ip, use_cache=True):
+        now = time.monotonic()
+        if use_cache:
+            with self._lock:
+                cached = self._ping_cache.get(device_ip)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+
+        buffer = BytesIO()
+        handle = self.acquire(device_ip)
+        handle.setopt(pycurl.URL, f'http://{device_ip}/ping/')
+        handle.setopt(pycurl.WRITEDATA, buffer)
+        try:
+            handle.perform()
+            reachable = handle.getinfo(pycurl.RESPONSE_CODE) < 400
+            self.release(device_ip, handle)
+        except pycurl.error as e:
+            logger.warning('Could not connect to device %s pycurl: %s', device_ip, e)
+            reachable = False
+            self.release(device_ip, handle, reusable=False)
+
+        ttl = self.ping_cache_seconds if reachable else self.ping_failure_cache_seconds
+        with self._lock:
+            self._ping_cache[device_ip] = (reachable, time.monotonic() + ttl)
+        return reachable
+
+    def forget(self, device_ip):
+        """Descarta handles y ping en cache de un dispositivo (por ejemplo cuando cambia de IP)"""
+        with self._lock:
+            idle = self._idle.pop(device_ip, [])
+            self._ping_cache.pop(device_ip, None)
+        for handle in idle:
+            handle.close()
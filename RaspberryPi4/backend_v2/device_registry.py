@@ -0,0 +1,73 @@
+import threading
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+
+class DeviceRegistry:
+    """Cache en memoria de la coleccion devices: MAC -> {name, mac, latest_ip, sensor_list}.
+
+    Se carga completa la primera vez que se usa y las escrituras pasan por aqui
+    (write-through), asi que health_check, el scheduler y el arranque no consultan Mongo
+    por cada busqueda. Se recarga cada `refresh_seconds` por si otro proceso modifico
+    la coleccion.
+    """
+
+    def __init__(self, collection, refresh_seconds=60):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self._devices = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        devices = {device['mac']: device for device in self.collection.find({}, {'_id': 0})}
+        with self._lock:
+            self._devices = devices
+            self._loaded_at = time.monotonic()
+        return len(devices)
+
+    def get(self, mac):
+        self._refresh_if_stale()
+        with self._lock:
+            device = self._devices.get(mac)
+        if device is None:
+            # Pudo haberlo registrado otro proceso despues de la ultima carga
+            device = self.collection.find_one({'mac': mac}, {'_id': 0})
+            if device is not None:
+                with self._lock:
+                    self._devices[mac] = device
+        return dict(device) if device is not None else None
+
+    def get_many(self, macs):
+        """Regresa {mac: device} para las MAC que existen"""
+        self._refresh_if_stale()
+        with self._lock:
+            found = {mac: dict(self._devices[mac]) for mac in macs if mac in self._devices}
+        missing = [mac for mac in set(macs) if mac not in found]
+        if missing:
+            for device in self.collection.find({'mac': {'$in': missing}}, {'_id': 0}):
+                with self._lock:
+                    self._devices[device['mac']] = device
+                found[device['mac']] = dict(device)
+        return found
+
+    def add(self, device):
+        try:
+            self.collection.insert_one(dict(device))
+        except DuplicateKeyError:
+            # Otro worker registro la misma MAC al mismo tiempo (indice unico en mac)
+            self.collection.update_one({'mac': device['mac']}, {'$set': dict(device)})
+        with self._lock:
+            self._devices[device['mac']] = dict(device)
+
+    def update(self, mac, fields):
+        self.collection.update_one({'mac': mac}, {'$set': fields})
+        with self._lock:
+            if mac in self._devices:
+                self._devices[mac] = {**self._devices[mac], **fields}
+
+    def _refresh_if_stale(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_seconds:
+            self.load()
@@ -0,0 +1,29 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:2000")
+# One worker per core (4 on the Raspberry Pi 4); only one of them runs the scheduler
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Handlers mostly wait on Mongo, so each worker also serves a few requests with threads
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 60
+# Every worker must create its own MongoClient, poller and scheduler threads after the fork
+preload_app = False
+
+# Workers write their Prometheus metrics here so /metrics reports all of them (see metrics.py)
+prometheus_multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "cultivapp_prometheus"))
+
+
+def on_starting(server):
+    # Values from a previous run would be added to the new counters
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
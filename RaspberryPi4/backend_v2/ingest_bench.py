@@ -0,0 +1,183 @@
+"""Benchmark de carga para el ingest de lecturas (POST /plant_data y /plant_data/batch).
+
+Es open loop: los requests salen a una tasa fija sin esperar a que terminen los
+anteriores, asi que si el backend no alcanza la tasa la latencia crece en lugar de que
+baje la tasa. La latencia se mide desde la hora en que el request debia salir (incluye
+la espera por un worker libre) y el tiempo de servicio desde que realmente salio.
+
+    python ingest_bench.py --url http://192.168.0.6:2000 --rate 50 --duration 30
+    python ingest_bench.py --url http://192.168.0.6:2000 --rate 5 --batch-size 100 --plants 50 --sensors 4
+    MONGO_DB_MOCK=1 python ingest_bench.py --in-process --rate 200 --duration 10
+
+Con --in-process la app corre en este proceso con el test client de Flask (sin
+scheduler) contra la base de datos de db.py: un mongod local o, con MONGO_DB_MOCK=1,
+mongomock en memoria. Los resultados se guardan en JSON para comparar corridas.
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from plant_data_send import random_reading
+
+HTTP_HEADERS = {'Content-Type': 'application/json'}
+
+
+class HttpTarget:
+    """Manda los requests a un backend corriendo, con una sesion de requests por hilo"""
+
+    def __init__(self, url):
+        import requests
+        self.requests = requests
+        self.url = url.rstrip('/')
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = self.requests.Session()
+        return self._local.session
+
+    def request(self, method, path, data):
+        response = self._session().request(method, f'{self.url}{path}', json=data, headers=HTTP_HEADERS)
+        return response.status_code, len(response.content)
+
+
+class FlaskTarget:
+    """Manda los requests a la app en este proceso con un test client por hilo"""
+
+    def __init__(self):
+        from app import create_app
+        self.app = create_app(run_scheduler=False)
+        self._local = threading.local()
+
+    def request(self, method, path, data):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        response = self._local.client.open(path, method=method, json=data)
+        return response.status_code, len(response.data)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def rank(p):
+        return values[min(len(values) - 1, max(math.ceil(p / 100 * len(values)) - 1, 0))]
+    return {
+        'p50': round(rank(50), 3),
+        'p95': round(rank(95), 3),
+        'p99': round(rank(99), 3),
+        'max': round(values[-1], 3),
+        'mean': round(sum(values) / len(values), 3),
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(target, rate, duration, workers, plant_ids, sensors, batch_size):
+    total = int(rate * duration)
+    results = [None] * total
+
+    def reading(index):
+        data = random_reading(plant_ids[index % len(plant_ids)])
+        data['sensor_num'] = str(index // len(plant_ids) % sensors)
+        return data
+
+    def send(index, scheduled):
+        if batch_size:
+            path, data = '/plant_data/batch', [reading(index * batch_size + offset) for offset in range(batch_size)]
+        else:
+            path, data = '/plant_data', reading(index)
+        started = time.perf_counter()
+        try:
+            status, _ = target.request('POST', path, data)
+        except Exception as e:
+            status = type(e).__name__
+        finished = time.perf_counter()
+        results[index] = (status, (finished - scheduled) * 1000, (finished - started) * 1000)
+
+    start = time.perf_counter() + 0.1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index in range(total):
+            scheduled = start + index / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, index, scheduled)
+    elapsed = time.perf_counter() - start
+
+    status_codes = {}
+    for status, _, _ in results:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+    succeeded = [result for result in results if isinstance(result[0], int) and result[0] < 300]
+    readings_per_request = batch_size or 1
+    return {
+        'requests': total,
+        'succeeded': len(succeeded),
+        'failed': total - len(succeeded),
+        'status_codes': status_codes,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(succeeded) / elapsed, 2),
+        'readings_per_s': round(len(succeeded) * readings_per_request / elapsed, 2),
+        'latency_ms': percentiles([latency for _, latency, _ in succeeded]),
+        'service_ms': percentiles([service for _, _, service in succeeded]),
+    }
+
+
+parser = argparse.ArgumentParser(prog='ingest_bench.py', description='Open-loop load generator for the plant data ingest endpoints')
+target_group = parser.add_mutually_exclusive_group(required=True)
+target_group.add_argument('-u', '--url', help='backend base URL, e.g. http://192.168.0.6:2000')
+target_group.add_argument('--in-process', action='store_true', help='run the app in this process with the Flask test client')
+parser.add_argument('-r', '--rate', type=float, default=20, help='requests per second (default: 20)')
+parser.add_argument('-d', '--duration', type=float, default=10, help='seconds (default: 10)')
+parser.add_argument('-w', '--workers', type=int, default=16, help='concurrent requests (default: 16)')
+parser.add_argument('-p', '--plants', type=int, default=10, help='synthetic plant IDs (default: 10)')
+parser.add_argument('-s', '--sensors', type=int, default=1, help='sensor numbers per plant (default: 1)')
+parser.add_argument('-b', '--batch-size', type=int, default=0, help='readings per POST to /plant_data/batch; 0 posts single readings to /plant_data')
+parser.add_argument('-o', '--output', default=None, help='results file (default: ingest_bench_<timestamp>.json)')
+parser.add_argument('--cleanup', action='store_true', help='delete the readings of the synthetic plants when done')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    target = FlaskTarget() if args.in_process else HttpTarget(args.url)
+    plant_ids = [f'bench{index:03d}' for index in range(args.plants)]
+    config = {
+        'target': 'in-process' if args.in_process else args.url,
+        'rate': args.rate,
+        'duration': args.duration,
+        'workers': args.workers,
+        'plants': args.plants,
+        'sensors': args.sensors,
+        'batch_size': args.batch_size,
+        'mongo_db_mock': os.environ.get('MONGO_DB_MOCK') == '1',
+        'plant_data_layout': os.environ.get('PLANT_DATA_LAYOUT'),
+        'ingest_buffer_enabled': os.environ.get('INGEST_BUFFER_ENABLED') == '1',
+    }
+    print(f"[LOG] Sending {int(args.rate * args.duration)} requests at {args.rate}/s to {config['target']}")
+    summary = run(target, args.rate, args.duration, args.workers, plant_ids, args.sensors, args.batch_size)
+
+    if args.cleanup:
+        for plant_id in plant_ids:
+            target.request('DELETE', '/plant_data', {'plant_id': plant_id})
+
+    results = {'started': int(time.time() - summary['elapsed_s']), 'git_commit': git_commit(), 'config': config, **summary}
+    output = args.output or f'ingest_bench_{int(time.time())}.json'
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"[ OK ] {summary['succeeded']}/{summary['requests']} requests succeeded in {summary['elapsed_s']}s, status codes: {summary['status_codes']}")
+    print(f"\tThroughput: {summary['throughput_rps']} req/s, {summary['readings_per_s']} readings/s")
+    for name in ('latency_ms', 'service_ms'):
+        if summary[name]:
+            print(f"\t{name}: " + ', '.join(f'{key} {value}' for key, value in summary[name].items()))
+    print(f'[LOG] Results saved to {output}')
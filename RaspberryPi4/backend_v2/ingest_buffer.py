@@ -0,0 +1,131 @@
+import logging
+import queue
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """Cola write-behind para lecturas de plant_data.
+
+    Los requests agregan documentos ya validados a una cola acotada y un hilo en
+    segundo plano los escribe con `store.insert_many` cada `max_batch` documentos o cada
+    `flush_interval_ms` milisegundos, lo que ocurra primero. Si la cola esta llena
+    `put` regresa False y el llamador debe escribir de forma sincrona.
+
+    Las lecturas en cola se pierden si el proceso muere sin llamar a `stop`.
+    """
+
+    def __init__(self, store, max_batch=500, flush_interval_ms=250, max_queue=10000):
+        self.store = store
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'rejected_full': 0,
+            'flushed': 0,
+            'failed': 0,
+            'flushes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='ingest-buffer-flusher', daemon=True)
+        self._thread.start()
+        logger.info('Ingest buffer started (batch: %d, interval: %dms, queue: %d)', self.max_batch, int(self.flush_interval * 1000), self._queue.maxsize)
+
+    def stop(self, timeout=10):
+        """Detiene el flusher y escribe todo lo que quede en la cola"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # Por si el hilo no alcanzo a vaciar la cola dentro del timeout
+        self._flush(self._drain(self._queue.qsize()))
+        logger.info('Ingest buffer stopped, flushed: %d, failed: %d', self._stats['flushed'], self._stats['failed'])
+
+    def put(self, document):
+        try:
+            self._queue.put_nowait(document)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected_full'] += 1
+            return False
+        with self._lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        flushes = stats.pop('flushes')
+        total_flush_ms = stats.pop('total_flush_ms')
+        stats['flushes'] = flushes
+        stats['avg_flush_ms'] = round(total_flush_ms / flushes, 3) if flushes else 0.0
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_max'] = self._queue.maxsize
+        stats['running'] = self._thread is not None
+        return stats
+
+    def _drain(self, max_items):
+        documents = []
+        while len(documents) < max_items:
+            try:
+                documents.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return documents
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            documents = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(documents) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    documents.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                documents.extend(self._drain(self.max_batch - len(documents)))
+            self._flush(documents)
+        # Vaciar la cola al apagar
+        while True:
+            documents = self._drain(self.max_batch)
+            if not documents:
+                break
+            self._flush(documents)
+
+    def _flush(self, documents):
+        if not documents:
+            return
+        start = time.perf_counter()
+        inserted = 0
+        try:
+            inserted, errors = self.store.insert_many(documents)
+            if errors:
+                logger.error('Ingest buffer bulk write errors: %d', len(errors))
+        except PyMongoError as e:
+            logger.error('Ingest buffer could not write %d readings: %s', len(documents), e)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['flushed'] += inserted
+            self._stats['failed'] += len(documents) - inserted
+            self._stats['flushes'] += 1
+            self._stats['last_flush_ms'] = round(elapsed_ms, 3)
+            self._stats['max_flush_ms'] = round(max(self._stats['max_flush_ms'], elapsed_ms), 3)
+            self._stats['total_flush_ms'] += elapsed_ms
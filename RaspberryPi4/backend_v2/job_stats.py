@@ -0,0 +1,47 @@
+import threading
+import time
+
+from apscheduler.events import EVENT_JOB_MISSED
+
+
+class JobLagTracker:
+    """Retraso de cada job del scheduler respecto a su hora programada y ejecuciones perdidas.
+
+    Se registra como listener de APScheduler para EVENT_JOB_EXECUTED, EVENT_JOB_ERROR y
+    EVENT_JOB_MISSED. El retraso es la diferencia entre `scheduled_run_time` (que ya
+    incluye el jitter) y el momento en que termino el job; como los jobs de polling solo
+    encolan en el poller, es practicamente el tiempo que esperaron un hilo del executor.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.setdefault(event.job_id, {'runs': 0, 'missed': 0, 'last_lag_ms': 0.0, 'max_lag_ms': 0.0, 'total_lag_ms': 0.0, 'last_run': None})
+            if event.code == EVENT_JOB_MISSED:
+                job['missed'] += 1
+                return
+            lag_ms = max(now - event.scheduled_run_time.timestamp(), 0) * 1000
+            job['runs'] += 1
+            job['last_lag_ms'] = lag_ms
+            job['max_lag_ms'] = max(job['max_lag_ms'], lag_ms)
+            job['total_lag_ms'] += lag_ms
+            job['last_run'] = int(now)
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def stats(self):
+        """Regresa {job_id: {runs, missed, last_lag_ms, avg_lag_ms, max_lag_ms, last_run}}"""
+        with self._lock:
+            jobs = {job_id: dict(job) for job_id, job in self._jobs.items()}
+        for job in jobs.values():
+            total_lag_ms = job.pop('total_lag_ms')
+            job['avg_lag_ms'] = round(total_lag_ms / job['runs'], 3) if job['runs'] else 0.0
+            job['last_lag_ms'] = round(job['last_lag_ms'], 3)
+            job['max_lag_ms'] = round(job['max_lag_ms'], 3)
+        return jobs
@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+class LatestReadings:
+    """Ultima lectura de cada (plant_id, sensor_num) en memoria, para /plant/<plant_id>/latest.
+
+    Se actualiza con cada insert de plant_data_store (listener `record`) y al arrancar se
+    llena con una sola agregacion ($sort/$group) sobre todas las lecturas, asi que las
+    consultas nunca recorren el historial.
+
+    Con varios workers cada proceso solo ve sus propios inserts. Por eso una planta que no
+    se ha revisado en `refresh_seconds` se pone al dia con la misma agregacion, filtrada a
+    la planta y a lecturas desde el ultimo timestamp conocido (la lectura mas nueva o el
+    momento del seed): regresa a lo mas una lectura por sensor aunque el worker lleve dias
+    sin ver la planta. Con `refresh_seconds=0` no se consulta Mongo.
+    """
+
+    def __init__(self, store, refresh_seconds=5):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self._latest = {}
+        self._checked_at = {}
+        self._seeded_at = None
+        self._lock = threading.Lock()
+
+    def record(self, documents):
+        """Listener de plant_data_store: guarda las lecturas si son mas nuevas que las conocidas"""
+        with self._lock:
+            for doc in documents:
+                sensors = self._latest.setdefault(doc['plant_id'], {})
+                current = sensors.get(doc.get('sensor_num'))
+                if current is None or doc['timestamp'] >= current['timestamp']:
+                    sensors[doc.get('sensor_num')] = {key: value for key, value in doc.items() if key != '_id'}
+
+    def _newest(self, plant_id=None, start=None):
+        """Lectura mas nueva de cada (plant_id, sensor_num) desde `start`, agrupada en Mongo"""
+        collection, pipeline = self.store.aggregation_source(start, plant_id=plant_id)
+        pipeline = pipeline + [
+            {'$sort': {'timestamp': -1}},
+            {'$group': {'_id': {'plant_id': '$plant_id', 'sensor_num': '$sensor_num'}, 'reading': {'$first': '$$ROOT'}}},
+            {'$replaceRoot': {'newRoot': '$reading'}},
+        ]
+        return list(collection.aggregate(pipeline, allowDiskUse=True))
+
+    def seed(self):
+        """Carga la lectura mas nueva de cada planta y sensor; regresa cuantas se cargaron"""
+        seeded_at = int(time.time())
+        readings = self._newest()
+        self.record(readings)
+        now = time.monotonic()
+        with self._lock:
+            self._seeded_at = seeded_at
+            self._checked_at = {plant_id: now for plant_id in self._latest}
+        return len(readings)
+
+    def forget(self, plant_id):
+        with self._lock:
+            self._latest.pop(plant_id, None)
+            self._checked_at.pop(plant_id, None)
+
+    def get(self, plant_id):
+        """Lecturas mas nuevas de la planta, una por sensor, o None si no tiene lecturas"""
+        self._refresh(plant_id)
+        with self._lock:
+            sensors = self._latest.get(plant_id)
+            return [dict(doc) for doc in sensors.values()] if sensors else None
+
+    def get_all(self):
+        """{plant_id: [lecturas mas nuevas por sensor]} de todas las plantas conocidas"""
+        with self._lock:
+            plant_ids = list(self._latest)
+        for plant_id in plant_ids:
+            self._refresh(plant_id)
+        with self._lock:
+            return {plant_id: [dict(doc) for doc in sensors.values()] for plant_id, sensors in self._latest.items() if sensors}
+
+    def _refresh(self, plant_id):
+        if not self.refresh_seconds:
+            return
+        now = time.monotonic()
+        with self._lock:
+            checked_at = self._checked_at.get(plant_id)
+            if checked_at is not None and now - checked_at < self.refresh_seconds:
+                return
+            self._checked_at[plant_id] = now
+            sensors = self._latest.get(plant_id)
+            since = max((doc['timestamp'] for doc in sensors.values()), default=None) if sensors else None
+            if since is None:
+                since = self._seeded_at
+        if since is None:
+            return # Sin seed no se sabe desde donde buscar sin recorrer el historial
+        self.record(self._newest(plant_id, since))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'plants': len(self._latest),
+                'readings': sum(len(sensors) for sensors in self._latest.values()),
+                'seeded_at': self._seeded_at,
+            }
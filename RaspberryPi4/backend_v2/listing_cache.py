@@ -0,0 +1,85 @@
+import threading
+import time
+import zlib
+
+from pymongo import ReturnDocument
+
+
+def bump_version(version_collection, name):
+    """Incrementa la version de un listado en Mongo y regresa la nueva version.
+
+    Lo deben llamar todas las escrituras a la coleccion, tambien las de scripts fuera de la app.
+    """
+    doc = version_collection.find_one_and_update({'_id': name}, {'$inc': {'version': 1}},
+                                                 upsert=True, return_document=ReturnDocument.AFTER)
+    return doc['version']
+
+
+class ListingCache:
+    """Cache de las respuestas de los listados completos (/plant, /device, /garden) por version de coleccion.
+
+    Cada listado tiene un contador de version en la coleccion `collection_versions` que
+    las escrituras incrementan con `bump`. El cuerpo JSON se guarda junto con la version
+    con la que se construyo y su ETag ("<version>-<crc32 del cuerpo>"); mientras la
+    version no cambie se responde desde memoria sin consultar la coleccion.
+
+    Las versiones se vuelven a leer de Mongo cada `recheck_seconds` para ver las
+    escrituras de otros workers o nodos, y un cuerpo se reconstruye despues de
+    `max_age_seconds` aunque la version sea la misma, por si la coleccion se modifico
+    sin pasar por la API. Si el contenido no cambio el ETag tampoco cambia.
+    """
+
+    def __init__(self, version_collection, recheck_seconds=5, max_age_seconds=60):
+        self.version_collection = version_collection
+        self.recheck_seconds = recheck_seconds
+        self.max_age_seconds = max_age_seconds
+        self._versions = {}
+        self._versions_loaded_at = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'bumps': 0}
+
+    def bump(self, name):
+        version = bump_version(self.version_collection, name)
+        with self._lock:
+            self._versions[name] = max(version, self._versions.get(name, 0))
+            self._entries.pop(name, None)
+            self._stats['bumps'] += 1
+
+    def version(self, name):
+        with self._lock:
+            stale = self._versions_loaded_at is None or time.monotonic() - self._versions_loaded_at >= self.recheck_seconds
+        if stale:
+            versions = {doc['_id']: doc['version'] for doc in self.version_collection.find({})}
+            with self._lock:
+                # max: un bump local puede ser mas nuevo que lo que se acaba de leer
+                for key, version in versions.items():
+                    self._versions[key] = max(version, self._versions.get(key, 0))
+                self._versions_loaded_at = time.monotonic()
+        with self._lock:
+            return self._versions.get(name, 0)
+
+    def get(self, name, build):
+        """Regresa (etag, cuerpo) del listado; `build()` regresa el cuerpo en bytes y solo se llama si cambio la version"""
+        version = self.version(name)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry['version'] == version and time.monotonic() - entry['built_at'] < self.max_age_seconds:
+                self._stats['hits'] += 1
+                return entry['etag'], entry['body']
+            self._stats['misses'] += 1
+        body = build()
+        etag = f'{version}-{zlib.crc32(body):08x}'
+        with self._lock:
+            # Si hubo un bump mientras se construia, la version guardada ya no coincide y se reconstruye
+            self._entries[name] = {'version': version, 'etag': etag, 'body': body, 'built_at': time.monotonic()}
+        return etag, body
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'versions': dict(self._versions),
+                'cached': {name: {'version': entry['version'], 'etag': entry['etag'], 'bytes': len(entry['body'])}
+                           for name, entry in self._entries.items()},
+            }
@@ -0,0 +1,76 @@
+"""Configuracion de logging del backend.
+
+Los modulos usan `logging.getLogger(__name__)` y `setup_logging` instala un solo
+QueueHandler en el logger raiz: el hilo del request solo arma el mensaje y encola
+el LogRecord, y un QueueListener en otro hilo le da formato (texto o JSON) y lo
+escribe a stderr. Los mensajes de un nivel desactivado no se arman, asi que se deben
+pasar los argumentos a la llamada (`logger.debug('%s', datos)`) en lugar de f-strings.
+
+    LOG_LEVEL   DEBUG, INFO (default), WARNING o ERROR. El detalle por lectura es DEBUG
+    LOG_FORMAT  text (default) o json, un objeto JSON por linea
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# Atributos estandar de LogRecord; lo demas viene de `extra=` y se agrega al JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por linea con time, level, logger, message y los campos de `extra=`"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """Configura el logger raiz con un QueueHandler; llamarlo mas de una vez no hace nada"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    # Cola sin limite: si se llenara, un log bloquearia o perderia mensajes en el request
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    if root.getEffectiveLevel() > logging.DEBUG:
+        # APScheduler registra cada ejecucion de un job en INFO, una por lectura
+        logging.getLogger('apscheduler.executors').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Escribir los mensajes que quedan en la cola al salir
+    atexit.register(_listener.stop)
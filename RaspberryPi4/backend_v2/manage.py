@@ -0,0 +1,273 @@
+"""Comandos de mantenimiento para la base de datos del backend.
+
+    python manage.py migrate-types [--batch-size 1000] [--restart]
+    python manage.py copy-layout [--batch-size 1000] [--restart]
+    python manage.py backfill-rollups [--interval 1h|1d|all] [--from TIMESTAMP] [--to TIMESTAMP]
+    python manage.py explain-queries [--plant-id PLANT_ID]
+    python manage.py archive --older-than-days DAYS
+    python manage.py export [--format csv|parquet|arrow] [--plant-id ID ...] [--from TIMESTAMP] [--to TIMESTAMP] [--profile notebook] [-o FILE]
+"""
+import argparse
+import json
+import sys
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne, monitoring
+from pymongo.errors import OperationFailure
+
+from log_config import setup_logging
+setup_logging()
+
+from query_audit import QueryRecorder, explain_command, query_filter, query_shape
+# Se registra antes de importar db para que el MongoClient lo incluya (explain-queries)
+query_recorder = QueryRecorder()
+monitoring.register(query_recorder)
+
+from db import PLANT_DATA_LAYOUT, COPY_LAYOUT_ID, plant_db, plant_collection, plant_data_collection, plant_data_store, plant_data_reader, cold_archive, rollup_store, migration_collection
+from readings import SENSOR_VALUE_FIELDS, parse_reading_value, parse_timestamp
+from rollups import ROLLUP_INTERVALS
+from plant_data_store import create_plant_data_store
+from plant_export import EXPORT_FORMATS, EXPORT_PROFILES, export_chunks, export_documents
+
+MIGRATE_TYPES_ID = 'plant_data_numeric_types'
+
+
+def migrate_types(batch_size, restart=False):
+    """Convierte en su lugar los valores string de plant_data a double/null.
+
+    Recorre la coleccion por _id y guarda el ultimo _id procesado en la coleccion
+    migrations, asi que se puede interrumpir y volver a correr. Se puede ejecutar con
+    el backend en linea: las lecturas nuevas ya se guardan como numeros.
+    """
+    if restart:
+        migration_collection.delete_one({'_id': MIGRATE_TYPES_ID})
+    progress = migration_collection.find_one({'_id': MIGRATE_TYPES_ID}) or {}
+    last_id = progress.get('last_id')
+    converted = progress.get('converted', 0)
+    if last_id is not None:
+        print(f'[LOG] Resuming migration after _id {last_id} ({converted} documents converted so far)')
+
+    string_fields = [{field: {'$type': 'string'}} for field in SENSOR_VALUE_FIELDS]
+    projection = {field: 1 for field in SENSOR_VALUE_FIELDS}
+    start = time.time()
+    while True:
+        query = {'$or': string_fields}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(plant_data_collection.find(query, projection).sort('_id', ASCENDING).limit(batch_size))
+        if not batch:
+            break
+
+        operations = []
+        for doc in batch:
+            original = {field: doc[field] for field in SENSOR_VALUE_FIELDS if isinstance(doc.get(field), str)}
+            converted_fields = {field: parse_reading_value(value) for field, value in original.items()}
+            # El filtro incluye los valores originales para no pisar una escritura concurrente
+            operations.append(UpdateOne({'_id': doc['_id'], **original}, {'$set': converted_fields}))
+        result = plant_data_collection.bulk_write(operations, ordered=False)
+
+        last_id = batch[-1]['_id']
+        converted += result.modified_count
+        migration_collection.update_one({'_id': MIGRATE_TYPES_ID},
+                                        {'$set': {'last_id': last_id, 'converted': converted, 'updated': int(time.time())}},
+                                        upsert=True)
+        print(f'[LOG] Converted {converted} documents ({time.time() - start:.1f}s)')
+
+    migration_collection.update_one({'_id': MIGRATE_TYPES_ID}, {'$set': {'finished': int(time.time())}}, upsert=True)
+    print(f'[ OK ] Migration finished, {converted} documents converted')
+
+
+def copy_layout(batch_size, restart=False):
+    """Copia las lecturas de la coleccion plant_data original al layout configurado (PLANT_DATA_LAYOUT).
+
+    Igual que migrate-types guarda el ultimo _id copiado; si se interrumpe a la mitad
+    de un lote ese lote puede quedar duplicado en el destino. Con PLANT_DATA_LAYOUT=auto
+    el backend sigue usando plant_data hasta que la copia termina (ver db.py).
+    La copia no pasa por los rollups: las lecturas ya se sumaron al guardarse o con backfill-rollups.
+    """
+    target = create_plant_data_store(plant_db, PLANT_DATA_LAYOUT)
+    if target.layout == 'flat':
+        print('[LOG] PLANT_DATA_LAYOUT is flat, plant_data is already the active collection. Nothing to copy')
+        return
+    target.ensure_collection()
+    progress = migration_collection.find_one({'_id': COPY_LAYOUT_ID}) or {}
+    if restart or progress.get('layout') not in (None, target.layout):
+        migration_collection.delete_one({'_id': COPY_LAYOUT_ID})
+        progress = {}
+    last_id = progress.get('last_id')
+    copied = progress.get('copied', 0)
+    if last_id is not None:
+        print(f'[LOG] Resuming copy after _id {last_id} ({copied} readings copied so far)')
+
+    start = time.time()
+    while True:
+        query = {} if last_id is None else {'_id': {'$gt': last_id}}
+        batch = list(plant_data_collection.find(query).sort('_id', ASCENDING).limit(batch_size))
+        if not batch:
+            break
+        for doc in batch:
+            # Por si migrate-types no se ha corrido
+            for field in SENSOR_VALUE_FIELDS:
+                if isinstance(doc.get(field), str):
+                    doc[field] = parse_reading_value(doc[field])
+        last_id = batch[-1]['_id']
+        inserted, errors = target.insert_many(batch)
+        if errors:
+            print(f'[ERROR] {len(errors)} readings could not be copied: {errors[0]["errmsg"]}')
+        copied += inserted
+        migration_collection.update_one({'_id': COPY_LAYOUT_ID},
+                                        {'$set': {'last_id': last_id, 'copied': copied, 'layout': target.layout, 'updated': int(time.time())}},
+                                        upsert=True)
+        print(f'[LOG] Copied {copied} readings to {target.layout} layout ({time.time() - start:.1f}s)')
+
+    migration_collection.update_one({'_id': COPY_LAYOUT_ID}, {'$set': {'finished': int(time.time()), 'layout': target.layout}}, upsert=True)
+    print(f'[ OK ] Copy finished, {copied} readings copied. The legacy plant_data collection can be dropped once verified')
+    if plant_data_store.layout != target.layout:
+        print('[WARNING] The backend keeps using plant_data until it is restarted. Run copy-layout again after the restart '
+              'to copy the readings written in between')
+
+
+def backfill_rollups(interval, start=None, end=None):
+    rollup_store.ensure_collections()
+    intervals = list(ROLLUP_INTERVALS) if interval == 'all' else [interval]
+    for interval in intervals:
+        begin = time.time()
+        written = rollup_store.backfill(plant_data_store, interval, start, end)
+        print(f'[ OK ] Backfilled {written} {interval} rollups ({time.time() - begin:.1f}s)')
+
+
+def explain_queries(plant_id=None):
+    """Ejecuta las consultas de la API, del scheduler y del registro de dispositivos, y revisa
+    el plan de cada forma de consulta con explain. Regresa cuantas consultas con filtro
+    recorren toda la coleccion (COLLSCAN)."""
+    from app import create_app, device_registry, encode_cursor, node_cluster, POLLING_PLANTS_QUERY
+
+    # create_app tambien crea los indices, igual que al arrancar el backend
+    app = create_app(run_scheduler=False)
+    if plant_id is None:
+        plant_id = (plant_collection.find_one({}, {'plant_id': 1}) or {}).get('plant_id', 'explain')
+    now = int(time.time())
+    test_client = app.test_client()
+    unknown_mac = '00:00:00:00:00:00'
+
+    query_recorder.start()
+    try:
+        urls = ['/plant', f'/plant/{plant_id}', '/device', '/garden',
+                f'/plant_data/{plant_id}',
+                f'/plant_data/{plant_id}?from={now - 86400}&to={now}',
+                f"/plant_data/{plant_id}?cursor={encode_cursor({'timestamp': now - 86400, '_id': ObjectId()})}"]
+        urls += [f'/plant_data/{plant_id}/rollup?interval={interval}&from={now - 86400}' for interval in ROLLUP_INTERVALS]
+        for url in urls:
+            test_client.get(url)
+        # Del streaming solo hace falta el primer lote para mandar la consulta
+        for url in (f'/plant_data/{plant_id}?stream=1', '/plant_data?stream=1'):
+            response = test_client.get(url)
+            next(iter(response.response), None)
+            response.close()
+        list(plant_collection.find(POLLING_PLANTS_QUERY, {'_id': 0}))
+        device_registry.get_many([unknown_mac])
+        device_registry.get(unknown_mac)
+        node_cluster.live_nodes()
+    finally:
+        commands = query_recorder.stop()
+
+    if not commands:
+        print('[ERROR] No queries were recorded. MONGO_DB_MOCK has no command monitoring, run this against a mongod')
+        return 0
+    flagged = 0
+    for database, command in commands:
+        command_name, collection = next(iter(command.items()))
+        query = query_filter(command)
+        description = f"{collection}.{command_name} {json.dumps(query_shape(query))}"
+        if command.get('sort'):
+            description += f" sort {json.dumps(command['sort'])}"
+        try:
+            stages, collscan = explain_command(plant_db.client[database], command)
+        except OperationFailure as e:
+            print(f'[ERROR] {description}: explain failed: {e}')
+            continue
+        if collscan and not query:
+            print(f"[LOG] {description}: {' > '.join(stages)} (no filter, full scan expected)")
+        elif collscan:
+            flagged += 1
+            print(f"[WARNING] {description}: {' > '.join(stages)}")
+        else:
+            print(f"[ OK ] {description}: {' > '.join(stages)}")
+    if flagged:
+        print(f'[WARNING] {flagged} of {len(commands)} query shapes scan the whole collection (COLLSCAN)')
+    else:
+        print(f'[ OK ] {len(commands)} query shapes checked, none with a filter scans the whole collection')
+    return flagged
+
+
+def export(export_format, plant_ids=None, start=None, end=None, profile='default', output=None, batch_size=10000):
+    """Escribe las lecturas a un archivo lote por lote (ver plant_export.py)"""
+    output = output or f'plant_data_{int(time.time())}.{EXPORT_FORMATS[export_format][1]}'
+    documents = export_documents(plant_data_reader, plant_ids, start, end, batch_size=batch_size)
+    chunks = export_chunks(documents, export_format, profile, batch_size=batch_size)
+    begin = time.time()
+    written = 0
+    with open(output, 'w' if export_format == 'csv' else 'wb', **({'newline': ''} if export_format == 'csv' else {})) as f:
+        for chunk in chunks:
+            written += f.write(chunk)
+    print(f'[ OK ] Exported {", ".join(plant_ids) if plant_ids else "all plants"} to {output} ({written} {"characters" if export_format == "csv" else "bytes"}, {time.time() - begin:.1f}s)')
+
+
+def archive(older_than_days):
+    """Archiva ahora lo que haria el job del scheduler con ARCHIVE_AFTER_DAYS=older_than_days"""
+    begin = time.time()
+    totals = cold_archive.archive(plant_data_store, int(time.time()) - older_than_days * 86400)
+    print(f"[ OK ] Archived {totals['archived']} readings of {totals['plants']} plants to {cold_archive.directory}, "
+          f"deleted {totals['deleted']} from Mongo ({time.time() - begin:.1f}s)")
+
+
+parser = argparse.ArgumentParser(prog='manage.py', description='CultivApp backend maintenance commands')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+migrate_types_parser = subparsers.add_parser('migrate-types', help='convert plant_data sensor values from strings to numbers')
+migrate_types_parser.add_argument('-b', '--batch-size', type=int, default=1000)
+migrate_types_parser.add_argument('--restart', action='store_true', help='ignore saved progress and scan from the beginning')
+
+copy_layout_parser = subparsers.add_parser('copy-layout', help='copy readings from the legacy plant_data collection to PLANT_DATA_LAYOUT')
+copy_layout_parser.add_argument('-b', '--batch-size', type=int, default=1000)
+copy_layout_parser.add_argument('--restart', action='store_true', help='ignore saved progress and copy from the beginning')
+backfill_rollups_parser = subparsers.add_parser('backfill-rollups', help='rebuild hourly/daily rollups from the stored readings')
+backfill_rollups_parser.add_argument('-i', '--interval', choices=[*ROLLUP_INTERVALS, 'all'], default='all')
+backfill_rollups_parser.add_argument('--from', dest='start', type=parse_timestamp, default=None, help='unix timestamp or ISO 8601 date')
+backfill_rollups_parser.add_argument('--to', dest='end', type=parse_timestamp, default=None, help='defaults to the start of the current interval')
+explain_queries_parser = subparsers.add_parser('explain-queries', help='create the indexes and flag app queries whose plan is a COLLSCAN')
+explain_queries_parser.add_argument('-p', '--plant-id', default=None, help='plant used by the per-plant queries (default: first plant)')
+archive_parser = subparsers.add_parser('archive', help='move readings older than N days to the on-disk archive (ARCHIVE_DIR)')
+archive_parser.add_argument('-d', '--older-than-days', type=int, required=True)
+export_parser = subparsers.add_parser('export', help='export readings as CSV, Parquet or Arrow (Parquet/Arrow need pyarrow)')
+export_parser.add_argument('-f', '--format', choices=list(EXPORT_FORMATS), default='csv')
+export_parser.add_argument('-p', '--plant-id', dest='plant_ids', action='append', default=None, help='repeat for several plants (default: all plants)')
+export_parser.add_argument('--from', dest='start', type=parse_timestamp, default=None, help='unix timestamp or ISO 8601 date')
+export_parser.add_argument('--to', dest='end', type=parse_timestamp, default=None, help='unix timestamp or ISO 8601 date')
+export_parser.add_argument('--profile', choices=EXPORT_PROFILES, default='default', help='notebook: column names of the training notebook')
+export_parser.add_argument('-b', '--batch-size', type=int, default=10000, help='rows per CSV chunk / Parquet row group')
+export_parser.add_argument('-o', '--output', default=None, help='default: plant_data_<timestamp>.<format>')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.command == 'migrate-types':
+        migrate_types(args.batch_size, args.restart)
+    elif args.command == 'copy-layout':
+        copy_layout(args.batch_size, args.restart)
+    elif args.command == 'backfill-rollups':
+        backfill_rollups(args.interval, args.start, args.end)
+    elif args.command == 'explain-queries':
+        sys.exit(1 if explain_queries(args.plant_id) else 0)
+    elif args.command == 'archive':
+        try:
+            archive(args.older_than_days)
+        except RuntimeError as e:
+            print(f'[ERROR] {e}')
+            sys.exit(1)
+    elif args.command == 'export':
+        try:
+            export(args.format, args.plant_ids, args.start, args.end, args.profile, args.output, args.batch_size)
+        except RuntimeError as e:
+            print(f'[ERROR] {e}')
+            sys.exit(1)
@@ -0,0 +1,99 @@
+"""Metricas del backend en formato de texto de Prometheus (GET /metrics).
+
+Se usan los tipos de prometheus_client: registrar una observacion es tomar un lock y
+sumar en memoria (unos microsegundos), el texto solo se arma cuando se consulta
+/metrics. Las tasas (lecturas por segundo, requests por segundo) se calculan en
+Prometheus con rate() sobre los contadores.
+
+Con varios workers de gunicorn, PROMETHEUS_MULTIPROC_DIR (lo pone gunicorn.conf.py)
+hace que cada proceso escriba sus valores en archivos de ese directorio y /metrics
+los suma. Los gauges calculados al consultar (jobs, polls pendientes, cola de ingest)
+no se exportan en ese modo porque solo existen en un proceso.
+"""
+import os
+import time
+
+from apscheduler.events import EVENT_JOB_MISSED
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from pymongo import monitoring
+
+# Buckets en segundos: requests y comandos de Mongo en el Pi van de ~1ms a varios segundos
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+HTTP_REQUESTS = Counter('cultivapp_http_requests_total', 'HTTP requests handled',
+                        ['route', 'method', 'status'])
+HTTP_REQUEST_LATENCY = Histogram('cultivapp_http_request_duration_seconds', 'Time to build the HTTP response (streamed bodies not included)',
+                                 ['route', 'method'], buckets=LATENCY_BUCKETS)
+
+READINGS_INGESTED = Counter('cultivapp_readings_ingested_total', 'Readings written to the plant data store')
+
+MONGO_COMMAND_LATENCY = Histogram('cultivapp_mongo_command_duration_seconds', 'MongoDB command latency',
+                                  ['collection', 'command'], buckets=LATENCY_BUCKETS)
+MONGO_COMMAND_FAILURES = Counter('cultivapp_mongo_command_failures_total', 'MongoDB commands that returned an error',
+                                 ['collection', 'command'])
+
+DEVICE_POLLS = Counter('cultivapp_device_polls_total', 'Plant readings requested from devices', ['result'])
+DEVICE_REQUEST_LATENCY = Histogram('cultivapp_device_request_duration_seconds', 'Device HTTP request latency (one request can read several plants)',
+                                   buckets=LATENCY_BUCKETS)
+DEVICE_POLL_QUEUE_WAIT = Histogram('cultivapp_device_poll_queue_seconds', 'Time a poll waits in the poller queue before its request starts',
+                                   buckets=LATENCY_BUCKETS)
+
+SCHEDULER_JOB_LAG = Histogram('cultivapp_scheduler_job_lag_seconds', 'Delay between a job scheduled run time and its execution',
+                              buckets=LATENCY_BUCKETS)
+SCHEDULER_MISSED_RUNS = Counter('cultivapp_scheduler_missed_runs_total', 'Job runs skipped because they started later than the misfire grace time')
+SCHEDULER_JOBS = Gauge('cultivapp_scheduler_jobs', 'Jobs registered in the scheduler')
+DEVICE_POLLER_PENDING = Gauge('cultivapp_device_poller_pending', 'Polls queued in the device poller')
+INGEST_BUFFER_QUEUED = Gauge('cultivapp_ingest_buffer_queued', 'Readings waiting in the ingest buffer')
+
+
+def record_request(route, method, status, seconds):
+    HTTP_REQUESTS.labels(route, method, status).inc()
+    HTTP_REQUEST_LATENCY.labels(route, method).observe(seconds)
+
+
+def record_readings(documents):
+    """Listener de plant_data_store: cuenta las lecturas escritas por cualquier ruta"""
+    READINGS_INGESTED.inc(len(documents))
+
+
+def record_scheduler_event(event):
+    """Listener de APScheduler para EVENT_JOB_EXECUTED, EVENT_JOB_ERROR y EVENT_JOB_MISSED"""
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_MISSED_RUNS.inc()
+        return
+    SCHEDULER_JOB_LAG.observe(max(time.time() - event.scheduled_run_time.timestamp(), 0))
+
+
+def render():
+    """Regresa (cuerpo, content type) para la respuesta de /metrics"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Mide la duracion de cada comando de Mongo por coleccion.
+
+    Los eventos succeeded/failed no traen el comando, asi que la coleccion se guarda al
+    empezar con la llave (conexion, request_id) y se saca al terminar.
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else 'admin'
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), 'unknown')
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), 'unknown')
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
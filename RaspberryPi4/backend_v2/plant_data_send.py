@@ -14,10 +14,11 @@ parser.add_argument('-p', '--port', default=2000)
 parser.add_argument('-c', '--count', default=3)
 parser.add_argument('-s', '--sleep', default=1)
 parser.add_argument('-i', '--id', default="00000000")
+parser.add_argument('-b', '--batch', action='store_true', help='send all readings in one POST to /plant_data/batch')
 
-def send_info(ip, port, id):
-    HTTP_HEADERS = {'Content-Type': 'application/json'}
+HTTP_HEADERS = {'Content-Type': 'application/json'}
 
+def random_reading(id):
     temp = str("{:.2f}".format(random.uniform(18, 36)))
     rel_hum =  str("{:.2f}".format(random.uniform(95, 100)))
     lux =  str(random.randint(0, 20000))
@@ -31,11 +32,22 @@ def send_info(ip, port, id):
             "moi_ana": moi_ana,
             "sensor_num": '0' # Hardcoded sensor number for testing purposes
             }
+    return data
+
+def send_info(ip, port, id):
+    data = random_reading(id)
     response = requests.post(f'http://{ip}:{port}/plant_data', json=data, headers=HTTP_HEADERS)
     print(f"Sending data: {data}")
     print(f"Response: {response.status_code}\n")
     print(f"Info: {response.json()}")
 
+def send_batch(ip, port, id, count):
+    data = [random_reading(id) for _ in range(count)]
+    response = requests.post(f'http://{ip}:{port}/plant_data/batch', json=data, headers=HTTP_HEADERS)
+    print(f"Sending batch of {count} readings")
+    print(f"Response: {response.status_code}\n")
+    print(f"Info: {response.json()}")
+
 if __name__ == "__main__":
     args = parser.parse_args()
     count = int(args.count)
@@ -44,7 +56,10 @@ if __name__ == "__main__":
     plant_id = args.id
     slp_sec = int(args.sleep)
     print(f"Destination IP: {ip}")
-    print(f"Number of POST Requests: {count}")
-    for _ in range(count):
-        send_info(ip, port, plant_id)
-        sleep(slp_sec)
\ No newline at end of file
+    if args.batch:
+        send_batch(ip, port, plant_id, count)
+    else:
+        print(f"Number of POST Requests: {count}")
+        for _ in range(count):
+            send_info(ip, port, plant_id)
+            sleep(slp_sec)
\ No newline at end of file
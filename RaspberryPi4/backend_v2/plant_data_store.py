@@ -0,0 +1,467 @@
+"""Almacenamiento de lecturas de plant_data.
+
+Todo el codigo que escribe o lee lecturas pasa por un `PlantDataStore`, que oculta
+como se guardan en Mongo. Hacia afuera una lectura siempre es un documento plano:
+
+    {'_id': ObjectId, 'plant_id': str, 'timestamp': int, 'temperature': float|None,
+     'relative_humidity': float|None, 'lux': float|None, 'moisture_value': float|None,
+     'sensor_num': str}
+
+Layouts disponibles (variable de entorno PLANT_DATA_LAYOUT):
+
+    flat        un documento por lectura en `plant_data` (layout original)
+    timeseries  coleccion time-series `plant_data_ts` (MongoDB >= 5.0)
+    bucket      un documento por planta por hora en `plant_data_buckets`, para
+                servidores sin time-series (MongoDB 4.4 es la ultima version
+                oficial que corre en el ARMv8.0 del Raspberry Pi 4)
+    auto        timeseries si el servidor lo soporta, si no bucket; flat mientras
+                plant_data tenga lecturas sin copiar (ver db.py)
+"""
+import calendar
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from readings import SENSOR_VALUE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+PLANT_DATA_LAYOUTS = ('flat', 'timeseries', 'bucket')
+
+
+def to_datetime(unix_timestamp):
+    return datetime.fromtimestamp(unix_timestamp, tz=timezone.utc)
+
+def to_unix(date):
+    # PyMongo regresa datetimes naive en UTC
+    return calendar.timegm(date.utctimetuple())
+
+def after_cursor(doc, after):
+    """True si la lectura va despues de la posicion (timestamp, _id) del cursor"""
+    if after is None:
+        return True
+    return (doc['timestamp'], doc['_id']) > after
+
+
+class PlantDataStore:
+    """Layout flat: un documento por lectura"""
+    layout = 'flat'
+
+    def __init__(self, db, name='plant_data'):
+        self.db = db
+        self.collection = db[name]
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Registra una funcion que recibe la lista de lecturas escritas en cada insert (rollups, etc)"""
+        self.listeners.append(listener)
+
+    def ensure_collection(self):
+        # (plant_id, timestamp, _id) sirve busquedas por planta, rangos de tiempo y el
+        # cursor (timestamp, _id) sin ordenar en memoria
+        self.collection.create_index([('plant_id', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)],
+                                     name='plant_id_timestamp')
+
+    def insert_one(self, document):
+        inserted, _ = self.insert_many([document])
+        return inserted == 1
+
+    def insert_many(self, documents):
+        """Escribe lecturas sin orden; regresa (insertadas, errores) con errores [{'index', 'errmsg'}]"""
+        if not documents:
+            return 0, []
+        inserted, errors = self._write(documents)
+        if self.listeners and inserted:
+            failed = {error['index'] for error in errors}
+            written = [doc for index, doc in enumerate(documents) if index not in failed]
+            for listener in self.listeners:
+                try:
+                    listener(written)
+                except Exception:
+                    # Un listener no debe hacer fallar la escritura de lecturas
+                    logger.exception('Plant data listener %s failed', getattr(listener, '__qualname__', listener))
+        return inserted, errors
+
+    def aggregation_source(self, start=None, end=None, plant_id=None):
+        """Regresa (coleccion, etapas) para agregaciones: despues de las etapas cada documento
+        tiene la forma plana de una lectura con timestamp en [start, end) (y de `plant_id`), sin importar el layout"""
+        return self.collection, self._match_stages(self._timestamp_window(start, end), None if plant_id is None else {'plant_id': plant_id})
+
+    def _write(self, documents):
+        try:
+            return len(self.collection.insert_many(documents, ordered=False).inserted_ids), []
+        except BulkWriteError as e:
+            errors = [{'index': error['index'], 'errmsg': error.get('errmsg', 'Write error')}
+                      for error in e.details.get('writeErrors', [])]
+            return e.details.get('nInserted', 0), errors
+
+    def find(self, plant_id=None, start=None, end=None, after=None, limit=None, batch_size=None):
+        """Itera lecturas. Con plant_id van ordenadas por (timestamp, _id) y `after` es la
+        posicion (timestamp, ObjectId) de la ultima lectura vista. Sin plant_id no hay orden."""
+        query = {}
+        timestamp_range = self._timestamp_range(start, end)
+        if timestamp_range:
+            query['timestamp'] = timestamp_range
+        cursor = None
+        try:
+            if plant_id is None:
+                cursor = self.collection.find(query)
+            else:
+                query['plant_id'] = plant_id
+                if after is not None:
+                    query['$or'] = [
+                        {'timestamp': {'$gt': after[0]}},
+                        {'timestamp': after[0], '_id': {'$gt': after[1]}}
+                    ]
+                cursor = self.collection.find(query).sort([('timestamp', ASCENDING), ('_id', ASCENDING)])
+            if limit:
+                cursor.limit(limit)
+            if batch_size:
+                cursor.batch_size(batch_size)
+            for doc in cursor:
+                yield doc
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def delete_plant(self, plant_id):
+        return self.collection.delete_many({'plant_id': plant_id}).deleted_count
+
+    def can_delete_readings(self):
+        """True si el servidor permite delete_readings (el archivador lo necesita)"""
+        return True
+
+    def delete_readings(self, plant_id, readings):
+        """Borra las lecturas de la planta por _id (las que ya se archivaron, ver archive.py)"""
+        ids = [doc['_id'] for doc in readings]
+        return self.collection.delete_many({'plant_id': plant_id, '_id': {'$in': ids}}).deleted_count
+
+    def plant_ids(self):
+        return self.collection.distinct('plant_id')
+
+    def count(self):
+        return self.collection.estimated_document_count()
+
+    @staticmethod
+    def _timestamp_range(start, end):
+        timestamp_range = {}
+        if start is not None:
+            timestamp_range['$gte'] = start
+        if end is not None:
+            timestamp_range['$lte'] = end
+        return timestamp_range
+
+    @staticmethod
+    def _timestamp_window(start, end):
+        timestamp_range = {}
+        if start is not None:
+            timestamp_range['$gte'] = start
+        if end is not None:
+            timestamp_range['$lt'] = end
+        return timestamp_range
+
+    @staticmethod
+    def _match_stages(timestamp_range, query=None):
+        query = dict(query or {})
+        if timestamp_range:
+            query['timestamp'] = timestamp_range
+        return [{'$match': query}] if query else []
+
+
+class TimeSeriesPlantDataStore(PlantDataStore):
+    """Coleccion time-series con timeField `timestamp` y metaField `meta` = {plant_id, sensor_num}"""
+    layout = 'timeseries'
+    # Ventana de tiempo que se ordena por (timestamp, _id) en cada consulta por planta
+    SCAN_WINDOW_SECONDS = 6 * 3600
+
+    def __init__(self, db, name='plant_data_ts'):
+        super().__init__(db, name)
+        self.name = name
+
+    def ensure_collection(self):
+        if self.name not in self.db.list_collection_names():
+            self.db.create_collection(self.name, timeseries={
+                'timeField': 'timestamp',
+                'metaField': 'meta',
+                'granularity': 'seconds',
+            })
+        self.collection.create_index([('meta.plant_id', ASCENDING), ('timestamp', ASCENDING)],
+                                     name='plant_id_timestamp')
+
+    def _write(self, documents):
+        return super()._write([self._to_storage(doc) for doc in documents])
+
+    def aggregation_source(self, start=None, end=None, plant_id=None):
+        timestamp_range = {operator: to_datetime(value) for operator, value in self._timestamp_window(start, end).items()}
+        project = {
+            'plant_id': '$meta.plant_id',
+            'sensor_num': '$meta.sensor_num',
+            'timestamp': {'$toLong': {'$divide': [{'$toLong': '$timestamp'}, 1000]}},
+        }
+        for field in SENSOR_VALUE_FIELDS:
+            project[field] = 1
+        meta = None if plant_id is None else {'meta.plant_id': plant_id}
+        return self.collection, self._match_stages(timestamp_range, meta) + [{'$project': project}]
+
+    def find(self, plant_id=None, start=None, end=None, after=None, limit=None, batch_size=None):
+        if plant_id is None:
+            query = {}
+            timestamp_range = self._datetime_range(start, end)
+            if timestamp_range:
+                query['timestamp'] = timestamp_range
+            cursor = self.collection.find(query)
+            if batch_size:
+                cursor.batch_size(batch_size)
+            try:
+                for count, doc in enumerate(cursor, 1):
+                    yield self._from_storage(doc)
+                    if limit and count >= limit:
+                        break
+            finally:
+                cursor.close()
+            return
+
+        # Ordenar por (timestamp, _id) toda la coleccion seria un sort bloqueante sobre
+        # el rango completo; en su lugar se ordena una ventana de tiempo a la vez
+        if after is not None:
+            start = after[0] if start is None else max(start, after[0])
+        yielded = 0
+        window_start = self._next_timestamp(plant_id, start)
+        while window_start is not None and (end is None or window_start <= end):
+            window_end = window_start + self.SCAN_WINDOW_SECONDS
+            if end is not None:
+                window_end = min(window_end, end + 1)
+            query = {'meta.plant_id': plant_id, 'timestamp': self._datetime_range(window_start, window_end - 1)}
+            for doc in self.collection.find(query).sort([('timestamp', ASCENDING), ('_id', ASCENDING)]):
+                doc = self._from_storage(doc)
+                if not after_cursor(doc, after):
+                    continue
+                yield doc
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+            # Saltar directo a la siguiente lectura existente para no consultar ventanas vacias
+            window_start = self._next_timestamp(plant_id, window_end)
+
+    def delete_plant(self, plant_id):
+        return self.collection.delete_many({'meta.plant_id': plant_id}).deleted_count
+
+    def can_delete_readings(self):
+        # En MongoDB 5.0 y 6.x un delete en time-series solo puede filtrar por metaField,
+        # no por _id ni por timestamp
+        return server_major_version(self.db) >= 7
+
+    def delete_readings(self, plant_id, readings):
+        # Borrar con filtro en _id (no solo en meta) necesita MongoDB 7.0
+        ids = [doc['_id'] for doc in readings]
+        return self.collection.delete_many({'meta.plant_id': plant_id, '_id': {'$in': ids}}).deleted_count
+
+    def plant_ids(self):
+        return self.collection.distinct('meta.plant_id')
+
+    def count(self):
+        return self.collection.count_documents({})
+
+    def _next_timestamp(self, plant_id, start):
+        query = {'meta.plant_id': plant_id}
+        if start is not None:
+            query['timestamp'] = {'$gte': to_datetime(start)}
+        doc = self.collection.find_one(query, {'timestamp': 1}, sort=[('timestamp', ASCENDING)])
+        return to_unix(doc['timestamp']) if doc else None
+
+    @staticmethod
+    def _datetime_range(start, end):
+        timestamp_range = {}
+        if start is not None:
+            timestamp_range['$gte'] = to_datetime(start)
+        if end is not None:
+            timestamp_range['$lte'] = to_datetime(end)
+        return timestamp_range
+
+    @staticmethod
+    def _to_storage(doc):
+        stored = {
+            '_id': doc.get('_id') or ObjectId(),
+            'timestamp': to_datetime(doc['timestamp']),
+            'meta': {'plant_id': doc.get('plant_id'), 'sensor_num': doc.get('sensor_num')},
+        }
+        for field in SENSOR_VALUE_FIELDS:
+            stored[field] = doc.get(field)
+        return stored
+
+    @staticmethod
+    def _from_storage(stored):
+        meta = stored.get('meta') or {}
+        doc = {'_id': stored['_id'], 'plant_id': meta.get('plant_id'), 'timestamp': to_unix(stored['timestamp'])}
+        for field in SENSOR_VALUE_FIELDS:
+            doc[field] = stored.get(field)
+        doc['sensor_num'] = meta.get('sensor_num')
+        return doc
+
+
+class BucketPlantDataStore(PlantDataStore):
+    """Un documento por planta por hora: {plant_id, start, end, count, readings: [...]}"""
+    layout = 'bucket'
+    BUCKET_SECONDS = 3600
+
+    def __init__(self, db, name='plant_data_buckets'):
+        super().__init__(db, name)
+
+    def ensure_collection(self):
+        self.collection.create_index([('plant_id', ASCENDING), ('start', ASCENDING)],
+                                     name='plant_id_start', unique=True)
+
+    def aggregation_source(self, start=None, end=None, plant_id=None):
+        # Descartar buckets completos antes de desenrollar las lecturas
+        bucket_query = {} if plant_id is None else {'plant_id': plant_id}
+        bucket_range = {}
+        if start is not None:
+            bucket_range['$gte'] = start - start % self.BUCKET_SECONDS
+        if end is not None:
+            bucket_range['$lt'] = end
+        if bucket_range:
+            bucket_query['start'] = bucket_range
+        stages = [{'$match': bucket_query}] if bucket_query else []
+        return self.collection, stages + [
+            {'$unwind': '$readings'},
+            {'$replaceRoot': {'newRoot': {'$mergeObjects': [{'plant_id': '$plant_id'}, '$readings']}}},
+        ] + self._match_stages(self._timestamp_window(start, end))
+
+    def _write(self, documents):
+        buckets = {}
+        for index, doc in enumerate(documents):
+            start = doc['timestamp'] - doc['timestamp'] % self.BUCKET_SECONDS
+            reading = {'_id': doc.get('_id') or ObjectId(), 'timestamp': doc['timestamp']}
+            for field in SENSOR_VALUE_FIELDS:
+                reading[field] = doc.get(field)
+            reading['sensor_num'] = doc.get('sensor_num')
+            bucket = buckets.setdefault((doc.get('plant_id'), start), {'indexes': [], 'readings': []})
+            bucket['indexes'].append(index)
+            bucket['readings'].append(reading)
+
+        keys = list(buckets)
+        failed = self._write_buckets(keys, buckets)
+        # Dos upserts simultaneos del mismo bucket nuevo chocan con el indice unico; reintentar una vez
+        retry = [key for key, error in failed.items() if error.get('code') == 11000]
+        if retry:
+            retried = self._write_buckets(retry, buckets)
+            for key in retry:
+                failed.pop(key)
+            failed.update(retried)
+
+        errors = []
+        for key, error in failed.items():
+            errors.extend({'index': index, 'errmsg': error.get('errmsg', 'Write error')} for index in buckets[key]['indexes'])
+        return len(documents) - len(errors), sorted(errors, key=lambda error: error['index'])
+
+    def _write_buckets(self, keys, buckets):
+        operations = []
+        for plant_id, start in keys:
+            readings = buckets[(plant_id, start)]['readings']
+            operations.append(UpdateOne(
+                {'plant_id': plant_id, 'start': start},
+                {
+                    '$push': {'readings': {'$each': readings}},
+                    '$inc': {'count': len(readings)},
+                    '$setOnInsert': {'end': start + self.BUCKET_SECONDS},
+                },
+                upsert=True
+            ))
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return {keys[error['index']]: error for error in e.details.get('writeErrors', [])}
+
+    def find(self, plant_id=None, start=None, end=None, after=None, limit=None, batch_size=None):
+        query = {}
+        if plant_id is not None:
+            query['plant_id'] = plant_id
+            if after is not None:
+                start = after[0] if start is None else max(start, after[0])
+        bucket_range = {}
+        if start is not None:
+            bucket_range['$gte'] = start - start % self.BUCKET_SECONDS
+        if end is not None:
+            bucket_range['$lte'] = end
+        if bucket_range:
+            query['start'] = bucket_range
+
+        cursor = self.collection.find(query)
+        if plant_id is not None:
+            cursor.sort('start', ASCENDING)
+        if batch_size:
+            # Cada bucket trae cientos de lecturas
+            cursor.batch_size(max(1, batch_size // 100))
+        yielded = 0
+        try:
+            for bucket in cursor:
+                readings = bucket['readings']
+                if plant_id is not None:
+                    # Las lecturas de un bucket pueden llegar fuera de orden (importaciones, lotes)
+                    readings = sorted(readings, key=lambda reading: (reading['timestamp'], reading['_id']))
+                for reading in readings:
+                    if start is not None and reading['timestamp'] < start:
+                        continue
+                    if end is not None and reading['timestamp'] > end:
+                        continue
+                    if plant_id is not None and not after_cursor(reading, after):
+                        continue
+                    yield {'plant_id': bucket['plant_id'], **reading}
+                    yielded += 1
+                    if limit and yielded >= limit:
+                        return
+        finally:
+            cursor.close()
+
+    def delete_plant(self, plant_id):
+        deleted = sum(bucket.get('count', 0) for bucket in self.collection.find({'plant_id': plant_id}, {'count': 1}))
+        self.collection.delete_many({'plant_id': plant_id})
+        return deleted
+
+    def delete_readings(self, plant_id, readings):
+        """Quita las lecturas de sus buckets por _id y borra los buckets que quedan vacios"""
+        buckets = {}
+        for doc in readings:
+            buckets.setdefault(doc['timestamp'] - doc['timestamp'] % self.BUCKET_SECONDS, []).append(doc['_id'])
+        if not buckets:
+            return 0
+        deleted = 0
+        for start, ids in buckets.items():
+            result = self.collection.update_one(
+                {'plant_id': plant_id, 'start': start, 'readings._id': {'$in': ids}},
+                {'$pull': {'readings': {'_id': {'$in': ids}}}, '$inc': {'count': -len(ids)}}
+            )
+            deleted += len(ids) if result.modified_count else 0
+        self.collection.delete_many({'plant_id': plant_id, 'start': {'$in': list(buckets)}, 'readings': {'$size': 0}})
+        return deleted
+
+    def plant_ids(self):
+        return self.collection.distinct('plant_id')
+
+    def count(self):
+        return sum(bucket.get('count', 0) for bucket in self.collection.find({}, {'count': 1}))
+
+
+def server_major_version(db):
+    try:
+        return db.client.server_info()['versionArray'][0]
+    except Exception:
+        return 0
+
+def server_supports_timeseries(db):
+    return server_major_version(db) >= 5
+
+def create_plant_data_store(db, layout='auto'):
+    if layout == 'auto':
+        layout = 'timeseries' if server_supports_timeseries(db) else 'bucket'
+    if layout == 'timeseries':
+        return TimeSeriesPlantDataStore(db)
+    if layout == 'bucket':
+        return BucketPlantDataStore(db)
+    if layout == 'flat':
+        return PlantDataStore(db)
+    raise ValueError(f'Unknown plant data layout {layout}, expected one of {PLANT_DATA_LAYOUTS} or auto')
@@ -0,0 +1,168 @@
+"""Exportacion de lecturas en CSV, Parquet o Arrow (GET /plant_data/export y manage.py export).
+
+Las lecturas se leen del cursor de plant_data_store en lotes de `batch_size` filas y
+cada lote se convierte a columnas y se escribe antes de leer el siguiente, asi que la
+memoria no depende del tamano de la exportacion. Parquet y Arrow necesitan pyarrow
+(pip install pyarrow); CSV solo usa la libreria estandar.
+
+Con `profile='notebook'` las columnas usan los nombres de
+jupyter_notebooks/cherry_tomato_training.ipynb: `light` (lux) y `moisture` en porcentaje,
+calculado con la calibracion del firmware (esp8266/send-sensor-info-mux.py). El sensor de
+conductividad no existe en este hardware, asi que esa columna no se exporta.
+"""
+import csv
+import io
+
+from readings import SENSOR_VALUE_FIELDS, parse_reading_value
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = {
+    # formato: (mimetype, extension)
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+EXPORT_PROFILES = ('default', 'notebook')
+
+# Lecturas ADC del sensor capacitivo: en agua y al aire. Abajo de 50 el sensor no esta conectado
+MOISTURE_WET_ADC = 250
+MOISTURE_DRY_ADC = 500
+MOISTURE_MIN_VALID_ADC = 50
+
+
+def moisture_percent(value):
+    """Humedad del suelo en % con la misma formula que el firmware del ESP8266"""
+    if value is None or value < MOISTURE_MIN_VALID_ADC:
+        return None
+    percent = (1 - (value - MOISTURE_WET_ADC) / (MOISTURE_DRY_ADC - MOISTURE_WET_ADC)) * 100
+    return min(max(percent, 0.0), 100.0)
+
+
+def export_columns(profile='default'):
+    """[(columna, tipo, funcion(doc) -> valor)] del perfil"""
+    def field(name):
+        return lambda doc: parse_reading_value(doc.get(name))
+
+    def text(name):
+        return lambda doc: None if doc.get(name) is None else str(doc.get(name))
+
+    columns = [
+        ('timestamp', 'int', lambda doc: doc['timestamp']),
+        ('plant_id', 'string', text('plant_id')),
+        ('sensor_num', 'string', text('sensor_num')),
+    ]
+    if profile == 'notebook':
+        return columns + [
+            ('temperature', 'float', field('temperature')),
+            ('relative_humidity', 'float', field('relative_humidity')),
+            ('light', 'float', field('lux')),
+            ('moisture', 'float', lambda doc: moisture_percent(parse_reading_value(doc.get('moisture_value')))),
+            ('moisture_value', 'float', field('moisture_value')),
+        ]
+    return columns + [(name, 'float', field(name)) for name in SENSOR_VALUE_FIELDS]
+
+
+def column_batches(documents, columns, batch_size):
+    """Agrupa los documentos en lotes de columnas {columna: [valores]}"""
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield {name: [value(doc) for doc in batch] for name, _, value in columns}
+            batch = []
+    if batch:
+        yield {name: [value(doc) for doc in batch] for name, _, value in columns}
+
+
+def csv_chunks(documents, columns, batch_size):
+    """CSV en chunks de texto, uno por lote; los valores nulos quedan vacios"""
+    names = [name for name, _, _ in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(names)
+    yield buffer.getvalue()
+    for batch in column_batches(documents, columns, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(zip(*(batch[name] for name in names)))
+        yield buffer.getvalue()
+
+
+class ChunkSink(io.RawIOBase):
+    """Archivo de solo escritura para pyarrow que acumula bytes hasta que se piden con `drain`"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def arrow_schema(columns):
+    types = {'int': pyarrow.int64(), 'float': pyarrow.float64(), 'string': pyarrow.string()}
+    return pyarrow.schema([(name, types[kind]) for name, kind, _ in columns])
+
+
+def arrow_chunks(documents, columns, batch_size, export_format):
+    """Parquet (un row group por lote) o Arrow IPC stream (un record batch por lote) en chunks de bytes"""
+    schema = arrow_schema(columns)
+    sink = ChunkSink()
+    if export_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    try:
+        for batch in column_batches(documents, columns, batch_size):
+            record_batch = pyarrow.RecordBatch.from_pydict(batch, schema=schema)
+            if export_format == 'parquet':
+                writer.write_batch(record_batch, row_group_size=batch_size)
+            else:
+                writer.write_batch(record_batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(documents, export_format='csv', profile='default', batch_size=10000):
+    """Chunks (str para CSV, bytes para Parquet/Arrow) con las lecturas de `documents`"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format {export_format}')
+    if export_format != 'csv' and pyarrow is None:
+        raise RuntimeError(f'{export_format} export needs pyarrow (pip install pyarrow)')
+    columns = export_columns(profile)
+    if export_format == 'csv':
+        return csv_chunks(documents, columns, batch_size)
+    return arrow_chunks(documents, columns, batch_size, export_format)
+
+
+def export_documents(store, plant_ids=None, start=None, end=None, batch_size=10000):
+    """Lecturas de las plantas pedidas (o de todas) en [start, end]; con plant_ids van ordenadas por planta y tiempo"""
+    if not plant_ids:
+        yield from store.find(start=start, end=end, batch_size=batch_size)
+        return
+    for plant_id in plant_ids:
+        yield from store.find(plant_id, start, end, batch_size=batch_size)
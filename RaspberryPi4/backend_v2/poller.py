@@ -0,0 +1,199 @@
+import collections
+import json
+import logging
+import threading
+import time
+from io import BytesIO
+
+import pycurl
+
+from metrics import DEVICE_POLL_QUEUE_WAIT, DEVICE_POLLS, DEVICE_REQUEST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class DevicePoller:
+    """Motor de polling para los dispositivos con un solo hilo y pycurl.CurlMulti.
+
+    Los jobs del scheduler solo llaman a `submit`, que encola el request y regresa de
+    inmediato, asi que un dispositivo lento ya no ocupa un hilo del scheduler. El hilo
+    del poller atiende todos los requests en vuelo con un solo CurlMulti, con a lo mas
+    `max_per_device` requests simultaneos por dispositivo y `max_total` en total.
+
+    Las plantas pendientes que comparten dispositivo se agrupan en un solo POST a
+    `/data_multi/`, donde el ESP8266 lee el AHT10 y el BH1750 una vez y recorre los
+    canales del multiplexor en una pasada. Un request espera `coalesce_window`
+    segundos a que lleguen las demas plantas del mismo dispositivo. Si el firmware
+    no tiene esa ruta (404) el dispositivo se sigue consultando planta por planta.
+    """
+
+    # Canales del multiplexor en un ESP8266 (MAX_HUM_SENSORS en el firmware)
+    MAX_SENSORS_PER_REQUEST = 8
+
+    def __init__(self, client, max_per_device=1, max_total=64, coalesce_window=0.05):
+        self.client = client
+        self.max_per_device = max_per_device
+        self.max_total = max_total
+        self.coalesce_window = coalesce_window
+        self._single_devices = set() # dispositivos con firmware sin /data_multi/
+        self._pending = collections.deque()
+        self._queued = set() # plant_id encolados o en vuelo, para no acumular polls de un dispositivo lento
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats = {'submitted': 0, 'skipped': 0, 'succeeded': 0, 'failed': 0, 'device_requests': 0, 'total_latency_ms': 0.0}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='device-poller', daemon=True)
+        self._thread.start()
+        logger.info('Device poller started (max per device: %d, max in flight: %d)', self.max_per_device, self.max_total)
+
+    def stop(self, timeout=10):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info('Device poller stopped')
+
+    def submit(self, plant_id, device_ip, sensor_num):
+        """Encola un request de lectura para una planta; se ignora si ya hay uno pendiente"""
+        with self._lock:
+            if plant_id in self._queued:
+                self._stats['skipped'] += 1
+                return False
+            self._queued.add(plant_id)
+            self._pending.append((plant_id, device_ip, sensor_num, time.monotonic()))
+            self._stats['submitted'] += 1
+        self._wakeup.set()
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+            stats['queued_or_in_flight'] = len(self._queued)
+        stats['avg_latency_ms'] = round(stats.pop('total_latency_ms') / stats['device_requests'], 3) if stats['device_requests'] else 0.0
+        return stats
+
+    def _run(self):
+        multi = pycurl.CurlMulti()
+        in_flight = {} # device_ip -> requests en vuelo
+        handles = set()
+        while not self._stop_event.is_set():
+            handles.update(self._start_pending(multi, in_flight, len(handles)))
+            if not handles:
+                # Con requests pendientes esperando la ventana de agrupacion, revisar pronto
+                self._wakeup.wait(self.coalesce_window if self._pending else 1)
+                self._wakeup.clear()
+                continue
+
+            while True:
+                status, _ = multi.perform()
+                if status != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+            while True:
+                remaining, succeeded, failed = multi.info_read()
+                for handle in succeeded:
+                    status_code = handle.getinfo(pycurl.RESPONSE_CODE)
+                    self._finish(multi, handle, in_flight, f'HTTP {status_code}' if status_code >= 400 else None)
+                    handles.discard(handle)
+                for handle, _, error_message in failed:
+                    self._finish(multi, handle, in_flight, error_message)
+                    handles.discard(handle)
+                if remaining == 0:
+                    break
+            # Esperar actividad en los sockets, o despertar antes si llega un request nuevo
+            if not self._wakeup.is_set():
+                multi.select(0.05)
+            self._wakeup.clear()
+
+        for handle in handles:
+            multi.remove_handle(handle)
+            self.client.release(handle.device_ip, handle, reusable=False)
+        multi.close()
+
+    def _start_pending(self, multi, in_flight, active):
+        """Agrega a CurlMulti los requests pendientes que caben en los limites; regresa los handles nuevos"""
+        started = []
+        now = time.monotonic()
+        with self._lock:
+            # Agrupar por dispositivo conservando el orden de llegada
+            devices = {}
+            for request in self._pending:
+                devices.setdefault(request[1], []).append(request)
+            self._pending.clear()
+            for device_ip, requests in devices.items():
+                if (active + len(started) >= self.max_total
+                        or in_flight.get(device_ip, 0) >= self.max_per_device
+                        or now - requests[0][3] < self.coalesce_window):
+                    # Los requests de dispositivos ocupados conservan su lugar en la fila
+                    self._pending.extend(requests)
+                    continue
+                size = 1 if device_ip in self._single_devices else self.MAX_SENSORS_PER_REQUEST
+                batch, remaining = requests[:size], requests[size:]
+                self._pending.extend(remaining)
+                for request in batch:
+                    DEVICE_POLL_QUEUE_WAIT.observe(now - request[3])
+                in_flight[device_ip] = in_flight.get(device_ip, 0) + 1
+                handle = self._create_handle(device_ip, batch)
+                multi.add_handle(handle)
+                started.append(handle)
+        return started
+
+    def _create_handle(self, device_ip, requests):
+        # Timeouts de conexion y total los pone DeviceClient
+        handle = self.client.acquire(device_ip)
+        handle.buffer = BytesIO()
+        handle.device_ip = device_ip
+        handle.requests = requests
+        handle.started = time.perf_counter()
+        if len(requests) == 1 and device_ip in self._single_devices:
+            plant_id, _, sensor_num, _ = requests[0]
+            url = f'http://{device_ip}/data/'
+            payload = {"sensor_num": sensor_num, "plant_id": plant_id}
+        else:
+            url = f'http://{device_ip}/data_multi/'
+            payload = {"sensors": [{"sensor_num": sensor_num, "plant_id": plant_id} for plant_id, _, sensor_num, _ in requests]}
+        handle.setopt(pycurl.URL, url)
+        handle.setopt(pycurl.HTTPHEADER, ['Content-Type: application/json']) # Set content type for JSON
+        # JSON compacto: el firmware lee el request con un solo recv(1024)
+        handle.setopt(pycurl.POSTFIELDS, json.dumps(payload, separators=(',', ':')))
+        handle.setopt(pycurl.WRITEDATA, handle.buffer)
+        return handle
+
+    def _finish(self, multi, handle, in_flight, error_message):
+        device_ip = handle.device_ip
+        requests = handle.requests
+        latency_ms = (time.perf_counter() - handle.started) * 1000
+        legacy_firmware = error_message == 'HTTP 404' and device_ip not in self._single_devices
+        DEVICE_REQUEST_LATENCY.observe(latency_ms / 1000)
+        if error_message is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                response_body = handle.buffer.getvalue().decode('utf-8', errors='replace')
+                logger.debug('Recieved response from %s for %d plants (%.1fms): %s', device_ip, len(requests), latency_ms, response_body)
+        elif legacy_firmware:
+            logger.warning('Device %s does not support /data_multi/, polling its plants one at a time', device_ip)
+        else:
+            logger.warning('Could not connect to device %s for plants %s pycurl: %s', device_ip, ', '.join(request[0] for request in requests), error_message)
+        multi.remove_handle(handle)
+        # Un handle con error de red puede tener la conexion en mal estado
+        self.client.release(device_ip, handle, reusable=error_message is None or error_message.startswith('HTTP'))
+        in_flight[device_ip] -= 1
+        with self._lock:
+            self._stats['device_requests'] += 1
+            self._stats['total_latency_ms'] += latency_ms
+            if legacy_firmware:
+                # Reintentar de inmediato con el request de una planta
+                self._single_devices.add(device_ip)
+                self._pending.extendleft(reversed(requests))
+                return
+            for request in requests:
+                self._queued.discard(request[0])
+            self._stats['succeeded' if error_message is None else 'failed'] += len(requests)
+        DEVICE_POLLS.labels('success' if error_message is None else 'failure').inc(len(requests))
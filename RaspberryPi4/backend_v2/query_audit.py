@@ -0,0 +1,99 @@
+"""Auditoria de los planes de consulta (`python manage.py explain-queries`).
+
+QueryRecorder es un CommandListener de PyMongo que, mientras esta grabando, guarda un
+ejemplo de cada forma de consulta (find, aggregate, count, distinct) que manda la app.
+La forma es el comando con los valores reemplazados por su tipo, asi que dos consultas
+por plant_id distintos cuentan como una sola. Despues cada ejemplo se manda a
+`explain` (verbosity queryPlanner, no ejecuta la consulta) y se revisan las etapas del
+plan ganador: un COLLSCAN en una consulta con filtro significa que falta un indice.
+
+Las escrituras (update/delete) filtran por los mismos campos que las lecturas
+(plant_id, mac, _id), asi que no se graban: ejecutarlas para capturarlas modificaria
+los datos.
+"""
+import threading
+
+from pymongo import monitoring
+
+AUDITED_COMMANDS = ('find', 'aggregate', 'count', 'distinct')
+# Campos que agrega el driver a cada comando y que no son parte de la consulta
+DRIVER_FIELDS = {'lsid', 'txnNumber', 'readConcern', 'apiVersion', 'apiStrict', 'apiDeprecationErrors'}
+
+
+def query_shape(value):
+    """El valor con cada hoja reemplazada por el nombre de su tipo"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(item) for item in value[:1]]
+    return type(value).__name__
+
+
+def query_filter(command):
+    """Filtro de la consulta; para aggregate el $match de la primera etapa"""
+    if command.get('aggregate') is not None:
+        pipeline = command.get('pipeline') or [{}]
+        return pipeline[0].get('$match') or {}
+    return command.get('filter') or command.get('query') or {}
+
+
+def plan_stages(explain_output):
+    """Nombres de las etapas de los planes ganadores en la salida de explain"""
+    stages = []
+
+    def walk(value, in_winning_plan):
+        if isinstance(value, dict):
+            if in_winning_plan and 'stage' in value:
+                stages.append(value['stage'])
+            for key, item in value.items():
+                if key == 'rejectedPlans':
+                    continue
+                walk(item, in_winning_plan or key == 'winningPlan')
+        elif isinstance(value, list):
+            for item in value:
+                walk(item, in_winning_plan)
+
+    walk(explain_output, False)
+    return stages
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """Registrar con `pymongo.monitoring.register` antes de crear el MongoClient (importar db)"""
+
+    def __init__(self):
+        self._recording = False
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._commands = {}
+            self._recording = True
+
+    def stop(self):
+        """Deja de grabar y regresa [(database, command)] con una consulta por forma"""
+        with self._lock:
+            self._recording = False
+            return list(self._commands.values())
+
+    def started(self, event):
+        if not self._recording or event.command_name not in AUDITED_COMMANDS:
+            return
+        command = {key: value for key, value in event.command.items()
+                   if key not in DRIVER_FIELDS and not key.startswith('$')}
+        key = (event.database_name, repr(query_shape(command)))
+        with self._lock:
+            self._commands.setdefault(key, (event.database_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def explain_command(database, command):
+    """Regresa (etapas del plan ganador, True si hay COLLSCAN)"""
+    explain_output = database.command('explain', command, verbosity='queryPlanner')
+    stages = plan_stages(explain_output)
+    return stages, 'COLLSCAN' in stages
@@ -0,0 +1,148 @@
+"""Benchmark de los endpoints de lectura con el test client de Flask.
+
+Cada caso se repite `--repeat` veces y se registra la latencia (p50/p95/max), el tamano
+de la respuesta (las respuestas en streaming se consumen completas) y el RSS maximo del
+proceso mientras corre el caso, muestreado de /proc/self/statm. Sirve para comparar
+layouts, indices, streaming y rollups con el mismo conjunto de datos.
+
+    MONGO_DB_MOCK=1 python read_bench.py --generate --plants 20 --devices 5 --days 30
+    MONGO_DB_NAME=ver_2bd_bench python read_bench.py -o read_bench_timeseries.json
+
+Con --generate primero se cargan datos con synthetic_data.py (con un mongod real
+tambien hace falta --yes). Sin --generate se usan los datos que ya estan en la base.
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import threading
+import time
+
+from ingest_bench import git_commit, percentiles
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """RSS actual en bytes; si no hay /proc se usa el maximo del proceso"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # Linux reporta ru_maxrss en KiB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Muestrea el RSS en un hilo mientras corre un caso y guarda el maximo"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+
+def benchmark_cases(plant_id, now):
+    """(nombre, url, headers) de cada caso, de las consultas mas chicas a las mas grandes"""
+    day = 86400
+    return [
+        ('plant_list', '/plant', {}),
+        ('device_list', '/device', {}),
+        ('plant_by_id', f'/plant/{plant_id}', {}),
+        ('plant_data_first_page', f'/plant_data/{plant_id}', {}),
+        ('plant_data_last_day', f'/plant_data/{plant_id}?from={now - day}&to={now}', {}),
+        ('plant_data_last_week_stream', f'/plant_data/{plant_id}?from={now - 7 * day}&to={now}&stream=1', {}),
+        ('rollup_1h_last_week', f'/plant_data/{plant_id}/rollup?interval=1h&from={now - 7 * day}', {}),
+        ('rollup_1d_all', f'/plant_data/{plant_id}/rollup?interval=1d', {}),
+        ('plant_data_plant_all_stream', f'/plant_data/{plant_id}?stream=1', {}),
+        ('plant_data_all', '/plant_data', {}),
+        ('plant_data_all_stream', '/plant_data', {'Accept': 'application/x-ndjson'}),
+    ]
+
+
+def run_case(client, url, headers, repeat):
+    latencies = []
+    sizes = []
+    statuses = set()
+    gc.collect()
+    with RssSampler() as sampler:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            # Consumir el cuerpo completo: en streaming el trabajo ocurre aqui
+            size = sum(len(chunk) for chunk in response.response)
+            latencies.append((time.perf_counter() - start) * 1000)
+            sizes.append(size)
+            statuses.add(response.status_code)
+            response.close()
+    return {
+        'url': url,
+        'status_codes': sorted(statuses),
+        'latency_ms': percentiles(latencies),
+        'response_bytes': max(sizes),
+        'peak_rss_mb': round(sampler.peak_rss / 2 ** 20, 2),
+        'rss_growth_mb': round((sampler.peak_rss - sampler.start_rss) / 2 ** 20, 2),
+    }
+
+
+parser = argparse.ArgumentParser(prog='read_bench.py', description='Benchmark the read endpoints with the Flask test client')
+parser.add_argument('--generate', action='store_true', help='load synthetic data first (see synthetic_data.py)')
+parser.add_argument('-p', '--plants', type=int, default=20)
+parser.add_argument('-d', '--devices', type=int, default=5)
+parser.add_argument('--days', type=int, default=30)
+parser.add_argument('--yes', action='store_true', help='allow --generate to write to a real database')
+parser.add_argument('-r', '--repeat', type=int, default=5, help='requests per case (default: 5)')
+parser.add_argument('--plant-id', default=None, help='plant used by the per-plant cases (default: first synthetic plant)')
+parser.add_argument('-o', '--output', default=None, help='results file (default: read_bench_<timestamp>.json)')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    from app import create_app
+    from db import MONGO_DB_MOCK, MONGO_DB_NAME, PLANT_DATA_LAYOUT
+    import synthetic_data
+
+    app = create_app(run_scheduler=False)
+    config = {
+        'database': 'mongomock' if MONGO_DB_MOCK else MONGO_DB_NAME,
+        'plant_data_layout': PLANT_DATA_LAYOUT,
+        'repeat': args.repeat,
+    }
+    if args.generate:
+        if not MONGO_DB_MOCK and not args.yes:
+            parser.error(f'--generate writes synthetic data to the {MONGO_DB_NAME} database; use MONGO_DB_NAME to pick another database and pass --yes')
+        start = time.time()
+        written = synthetic_data.load_dataset(args.plants, args.devices, args.days)
+        print(f'[LOG] Loaded {written} synthetic readings ({time.time() - start:.1f}s)')
+        config.update({'plants': args.plants, 'devices': args.devices, 'days': args.days, 'readings': written})
+
+    client = app.test_client()
+    results = {}
+    for name, url, headers in benchmark_cases(args.plant_id or synthetic_data.plant_id(0), int(time.time())):
+        results[name] = run_case(client, url, headers, args.repeat)
+        latency = results[name]['latency_ms']
+        print(f"[ OK ] {name}: p50 {latency['p50']}ms, p95 {latency['p95']}ms, "
+              f"{results[name]['response_bytes']} bytes, peak RSS {results[name]['peak_rss_mb']}MB (+{results[name]['rss_growth_mb']}MB)")
+
+    output = args.output or f'read_bench_{int(time.time())}.json'
+    with open(output, 'w') as f:
+        json.dump({'started': int(time.time()), 'git_commit': git_commit(), 'config': config, 'cases': results}, f, indent=2)
+    print(f'[LOG] Results saved to {output}')
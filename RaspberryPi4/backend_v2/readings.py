@@ -0,0 +1,66 @@
+import math
+from datetime import datetime, timezone
+
+# Campos numericos de una lectura en plant_data y el campo que envia el ESP8266
+SENSOR_VALUE_FIELDS = {
+    'temperature': 'temp',
+    'relative_humidity': 'rel_hum',
+    'lux': 'lux',
+    'moisture_value': 'moi_ana',
+}
+
+def parse_reading_value(value):
+    """Convierte un valor del sensor ("23.50", "N/A", 23.5) a float, o None si no hay lectura"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        # "N/A" cuando el sensor no esta conectado
+        return None
+    if not math.isfinite(number):
+        return None
+    return number
+
+# Ultimo segundo que se puede guardar como fecha (9999-12-31T23:59:59Z, limite de datetime y del layout timeseries)
+MAX_TIMESTAMP = 253402300799
+
+def sensor_data_document(data, unix_timestamp):
+    """Convierte una lectura del ESP8266 al documento que se guarda en plant_data"""
+    document = {
+        'plant_id': data.get('plant_id'),
+        "timestamp": unix_timestamp,
+    }
+    for field, sensor_field in SENSOR_VALUE_FIELDS.items():
+        document[field] = parse_reading_value(data.get(sensor_field))
+    document["sensor_num"] = data.get('sensor_num')
+    return document
+
+def valid_timestamp(value):
+    """True si `value` es un unix timestamp entero entre 0 y MAX_TIMESTAMP"""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_TIMESTAMP
+
+def parse_timestamp(value):
+    """Convierte un unix timestamp o una fecha ISO 8601 (UTC si no trae zona horaria) a unix timestamp (int).
+
+    Lanza ValueError si el valor no es una fecha o queda fuera de 0..MAX_TIMESTAMP.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        timestamp = int(value)
+    except (TypeError, ValueError):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            date = datetime.fromisoformat(str(value))
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=timezone.utc)
+            number = date.timestamp()
+        # inf y nan no se pueden convertir a int
+        if not math.isfinite(number):
+            raise ValueError(f'Invalid timestamp {value}')
+        timestamp = int(number)
+    if not valid_timestamp(timestamp):
+        raise ValueError(f'Timestamp {value} out of range')
+    return timestamp
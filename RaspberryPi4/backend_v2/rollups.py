@@ -0,0 +1,154 @@
+"""Agregados por hora y por dia (min/avg/max) de las lecturas de cada planta.
+
+Cada intervalo tiene su coleccion (`plant_data_rollup_1h`, `plant_data_rollup_1d`) con
+un documento por planta por intervalo:
+
+    {'plant_id': str, 'start': int, 'count': int,
+     'temperature': {'count': int, 'sum': float, 'min': float, 'max': float}, ...}
+
+`RollupStore.record` se registra como listener de plant_data_store, asi que cada insert
+los actualiza con upserts $inc/$min/$max. `RollupStore.backfill` los reconstruye con un
+pipeline de agregacion para las lecturas historicas.
+"""
+import time
+
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+
+from readings import SENSOR_VALUE_FIELDS
+
+ROLLUP_INTERVALS = {
+    '1h': 3600,
+    '1d': 86400,
+}
+
+
+class RollupStore:
+
+    def __init__(self, db):
+        self.collections = {interval: db[f'plant_data_rollup_{interval}'] for interval in ROLLUP_INTERVALS}
+
+    def ensure_collections(self):
+        for collection in self.collections.values():
+            collection.create_index([('plant_id', ASCENDING), ('start', ASCENDING)], name='plant_id_start', unique=True)
+
+    def record(self, documents):
+        """Suma lecturas nuevas a los agregados (listener de plant_data_store)"""
+        for interval, seconds in ROLLUP_INTERVALS.items():
+            # Agrupar primero en memoria: un lote de lecturas se vuelve un upsert por planta por intervalo
+            groups = {}
+            for doc in documents:
+                start = doc['timestamp'] - doc['timestamp'] % seconds
+                group = groups.setdefault((doc['plant_id'], start), {'count': 0, 'fields': {}})
+                group['count'] += 1
+                for field in SENSOR_VALUE_FIELDS:
+                    value = doc.get(field)
+                    if value is None or isinstance(value, str):
+                        continue
+                    stats = group['fields'].get(field)
+                    if stats is None:
+                        group['fields'][field] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+                    else:
+                        stats['count'] += 1
+                        stats['sum'] += value
+                        stats['min'] = min(stats['min'], value)
+                        stats['max'] = max(stats['max'], value)
+
+            operations = []
+            for (plant_id, start), group in groups.items():
+                increments = {'count': group['count']}
+                minimums = {}
+                maximums = {}
+                for field, stats in group['fields'].items():
+                    increments[f'{field}.count'] = stats['count']
+                    increments[f'{field}.sum'] = stats['sum']
+                    minimums[f'{field}.min'] = stats['min']
+                    maximums[f'{field}.max'] = stats['max']
+                update = {'$inc': increments}
+                if minimums:
+                    update['$min'] = minimums
+                    update['$max'] = maximums
+                operations.append(UpdateOne({'plant_id': plant_id, 'start': start}, update, upsert=True))
+            if operations:
+                self.collections[interval].bulk_write(operations, ordered=False)
+
+    def delete_plant(self, plant_id):
+        for collection in self.collections.values():
+            collection.delete_many({'plant_id': plant_id})
+
+    def query(self, plant_id, interval, start=None, end=None):
+        """Regresa los agregados de una planta como [{'start', 'count', campo: {'min', 'avg', 'max'}}]"""
+        seconds = ROLLUP_INTERVALS[interval]
+        query = {'plant_id': plant_id}
+        start_range = {}
+        if start is not None:
+            start_range['$gte'] = start - start % seconds
+        if end is not None:
+            start_range['$lte'] = end
+        if start_range:
+            query['start'] = start_range
+
+        rollups = []
+        for doc in self.collections[interval].find(query, {'_id': 0}).sort('start', ASCENDING):
+            rollup = {'start': doc['start'], 'count': doc['count']}
+            for field in SENSOR_VALUE_FIELDS:
+                stats = doc.get(field)
+                if stats and stats.get('count'):
+                    rollup[field] = {'min': stats['min'], 'avg': stats['sum'] / stats['count'], 'max': stats['max']}
+                else:
+                    rollup[field] = None
+            rollups.append(rollup)
+        return rollups
+
+    def backfill(self, store, interval, start=None, end=None, batch_size=1000):
+        """Reconstruye los agregados de [start, end) desde las lecturas con un pipeline de agregacion.
+
+        `end` se redondea al inicio de su intervalo y por defecto es el intervalo actual: los
+        intervalos abiertos los sigue actualizando el ingest, y reemplazarlos aqui podria
+        perder lecturas concurrentes.
+        """
+        seconds = ROLLUP_INTERVALS[interval]
+        if end is None:
+            end = int(time.time())
+        # Solo intervalos completos: reemplazar uno parcial perderia las lecturas fuera del rango
+        end = end - end % seconds
+        if start is not None:
+            start = start - start % seconds
+        collection, pipeline = store.aggregation_source(start, end)
+
+        group = {
+            '_id': {'plant_id': '$plant_id', 'start': {'$subtract': ['$timestamp', {'$mod': ['$timestamp', seconds]}]}},
+            'count': {'$sum': 1},
+        }
+        project = {'_id': 0, 'plant_id': '$_id.plant_id', 'start': '$_id.start', 'count': 1}
+        for field in SENSOR_VALUE_FIELDS:
+            # $sum/$min/$max ignoran null y strings ("N/A" en datos sin migrar)
+            group[f'{field}_count'] = {'$sum': {'$cond': [{'$isNumber': f'${field}'}, 1, 0]}}
+            group[f'{field}_sum'] = {'$sum': f'${field}'}
+            group[f'{field}_min'] = {'$min': f'${field}'}
+            group[f'{field}_max'] = {'$max': f'${field}'}
+            project[field] = {
+                'count': f'${field}_count',
+                'sum': f'${field}_sum',
+                'min': f'${field}_min',
+                'max': f'${field}_max',
+            }
+        pipeline = pipeline + [
+            {'$group': group},
+            {'$project': project},
+        ]
+
+        written = 0
+        operations = []
+        for rollup in collection.aggregate(pipeline, allowDiskUse=True):
+            for field in SENSOR_VALUE_FIELDS:
+                if not rollup[field]['count']:
+                    del rollup[field]
+            operations.append(ReplaceOne({'plant_id': rollup['plant_id'], 'start': rollup['start']}, rollup, upsert=True))
+            if len(operations) >= batch_size:
+                self.collections[interval].bulk_write(operations, ordered=False)
+                written += len(operations)
+                operations = []
+        if operations:
+            self.collections[interval].bulk_write(operations, ordered=False)
+            written += len(operations)
+        return written
@@ -0,0 +1,43 @@
+import fcntl
+import os
+
+
+class SchedulerLock:
+    """Lock de archivo para que un solo proceso del nodo corra el scheduler y el poller.
+
+    Con varios workers de gunicorn cada uno crea la app; el primero que toma el lock
+    (flock exclusivo, sin bloquear) es el dueno del scheduler y los demas solo atienden
+    la API. El sistema operativo libera el lock cuando el proceso muere, asi que otro
+    worker lo puede tomar en su siguiente intento.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Intenta tomar el lock sin bloquear; regresa True si este proceso lo tiene"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # PID del dueno, solo informativo
+        os.ftruncate(fd, 0)
+        os.write(fd, f'{os.getpid()}\n'.encode('ascii'))
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
@@ -0,0 +1,141 @@
+"""Generador de datos sinteticos: dispositivos, plantas y meses de lecturas.
+
+Los valores siguen los rangos de plant_data_send.py y de
+jupyter_notebooks/moniflora-backup-rtdb.csv (jitomate cherry, una lectura cada 5 min):
+
+    temperature        22-34 C, ciclo diario con el maximo a media tarde
+    relative_humidity  95-100 %
+    lux                0 de noche, hasta ~6700 al mediodia
+    moisture_value     ADC 200-700, baja mientras la tierra se seca y sube al regar
+
+Las lecturas se escriben con plant_data_store.insert_many, igual que el ingest, asi que
+sirven para cualquier PLANT_DATA_LAYOUT y tambien actualizan los rollups.
+
+    MONGO_DB_MOCK=1 python synthetic_data.py --plants 20 --devices 5 --days 30
+    MONGO_DB_NAME=ver_2bd_bench python synthetic_data.py --plants 50 --days 180 --yes
+"""
+import argparse
+import math
+import random
+import time
+
+from readings import sensor_data_document
+
+# Una lectura cada 5 minutos, como el respaldo de moniflora
+DEFAULT_INTERVAL_SECONDS = 300
+# Cada cuantos dias se riega (la humedad del suelo vuelve a subir)
+WATERING_PERIOD_DAYS = 3
+
+
+def device_mac(index):
+    # Direccion administrada localmente, no choca con MACs reales
+    return f'02:00:00:00:{index // 256:02X}:{index % 256:02X}'
+
+
+def plant_id(index):
+    return f'bench{index:03d}'
+
+
+def generate_devices(count):
+    return [{
+        'name': 'ESP8266',
+        'mac': device_mac(index),
+        'latest_ip': f'10.0.{index // 256}.{index % 256}',
+        'sensor_list': [],
+    } for index in range(count)]
+
+
+def generate_plants(count, devices, interval=DEFAULT_INTERVAL_SECONDS, registered=None):
+    registered = int(time.time()) if registered is None else registered
+    return [{
+        'plant_id': plant_id(index),
+        'plant_name': f'plant_{index + 1}',
+        'plant_type': 'Cherry Tomato',
+        'plant_date': registered,
+        'plant_registered': registered,
+        'plant_update_poll': interval,
+        # Los datos sinteticos no deben hacer que el scheduler consulte dispositivos que no existen
+        'update_poll_activated': False,
+        'device_mac': devices[index % len(devices)]['mac'],
+        'soil_sens_num': index // len(devices),
+    } for index in range(count)]
+
+
+def synthetic_reading(plant, timestamp, rng):
+    """Lectura con el formato que manda el ESP8266 (valores como strings)"""
+    day_fraction = (timestamp % 86400) / 86400
+    # Minimo al amanecer, maximo hacia las 15:00
+    temperature = 28 + 5 * math.sin(2 * math.pi * (day_fraction - 0.375)) + rng.gauss(0, 0.6)
+    daylight = math.sin(math.pi * (day_fraction - 0.25) * 2) if 0.25 < day_fraction < 0.75 else 0
+    lux = max(0, 6700 * daylight + rng.gauss(0, 150)) if daylight else 0
+    watering_phase = (timestamp / 86400 / WATERING_PERIOD_DAYS + plant['soil_sens_num'] * 0.37) % 1
+    moisture = 700 - 500 * watering_phase + rng.gauss(0, 10)
+    return {
+        'plant_id': plant['plant_id'],
+        'sensor_num': str(plant['soil_sens_num']),
+        'temp': f'{min(max(temperature, 22), 34):.2f}',
+        'rel_hum': f'{rng.uniform(95, 100):.2f}',
+        'lux': str(int(lux)),
+        'moi_ana': str(int(min(max(moisture, 200), 700))),
+    }
+
+
+def generate_readings(plants, start, end, interval=DEFAULT_INTERVAL_SECONDS, seed=0):
+    """Genera los documentos de lecturas de [start, end) en orden de tiempo"""
+    rng = random.Random(seed)
+    for timestamp in range(start - start % interval, end, interval):
+        for plant in plants:
+            yield sensor_data_document(synthetic_reading(plant, timestamp, rng), timestamp)
+
+
+def load_dataset(plant_count, device_count, days, interval=DEFAULT_INTERVAL_SECONDS, batch_size=5000, seed=0):
+    """Carga dispositivos, plantas y `days` dias de lecturas hasta ahora; regresa el numero de lecturas"""
+    from db import collection_versions, device_collection, plant_collection, plant_data_store, rollup_store
+    from listing_cache import bump_version
+
+    plant_data_store.ensure_collection()
+    rollup_store.ensure_collections()
+    devices = generate_devices(device_count)
+    plants = generate_plants(plant_count, devices, interval)
+    device_collection.delete_many({'mac': {'$in': [device['mac'] for device in devices]}})
+    device_collection.insert_many([dict(device) for device in devices])
+    plant_collection.delete_many({'plant_id': {'$in': [plant['plant_id'] for plant in plants]}})
+    plant_collection.insert_many([dict(plant) for plant in plants])
+    # Para que los listados en cache de un backend corriendo se reconstruyan
+    bump_version(collection_versions, 'devices')
+    bump_version(collection_versions, 'plants')
+    for plant in plants:
+        plant_data_store.delete_plant(plant['plant_id'])
+        rollup_store.delete_plant(plant['plant_id'])
+
+    end = int(time.time())
+    written = 0
+    batch = []
+    for document in generate_readings(plants, end - days * 86400, end, interval, seed):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            written += plant_data_store.insert_many(batch)[0]
+            batch = []
+    if batch:
+        written += plant_data_store.insert_many(batch)[0]
+    return written
+
+
+parser = argparse.ArgumentParser(prog='synthetic_data.py', description='Bulk-load synthetic devices, plants and readings')
+parser.add_argument('-p', '--plants', type=int, default=20)
+parser.add_argument('-d', '--devices', type=int, default=5)
+parser.add_argument('--days', type=int, default=30)
+parser.add_argument('-i', '--interval', type=int, default=DEFAULT_INTERVAL_SECONDS, help='seconds between readings of a plant')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--yes', action='store_true', help='required to write to a real database (MONGO_DB_MOCK unset)')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    from log_config import setup_logging
+    setup_logging()
+    from db import MONGO_DB_MOCK, MONGO_DB_NAME
+    if not MONGO_DB_MOCK and not args.yes:
+        parser.error(f'this writes synthetic data to the {MONGO_DB_NAME} database; use MONGO_DB_NAME to pick another database and pass --yes')
+    start = time.time()
+    written = load_dataset(args.plants, args.devices, args.days, args.interval, seed=args.seed)
+    print(f'[ OK ] Loaded {args.devices} devices, {args.plants} plants and {written} readings into {MONGO_DB_NAME} ({time.time() - start:.1f}s)')
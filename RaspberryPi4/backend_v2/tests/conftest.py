@@ -0,0 +1,25 @@
+"""Pruebas de la API con mongomock (pip install pytest mongomock); se corren desde backend_v2 con `python -m pytest tests`"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Antes de importar app: base de datos en memoria y archivos en un directorio temporal
+TEST_DIRECTORY = tempfile.mkdtemp(prefix='cultivapp_tests_')
+os.environ['MONGO_DB_MOCK'] = '1'
+os.environ['ARCHIVE_DIR'] = os.path.join(TEST_DIRECTORY, 'archive')
+os.environ['SCHEDULER_LOCK_FILE'] = os.path.join(TEST_DIRECTORY, 'scheduler.lock')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as cultivapp  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    return cultivapp.create_app(run_scheduler=False)
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
@@ -0,0 +1,94 @@
+import os
+import threading
+
+import pytest
+
+from archive import ColdArchive, TieredPlantData
+from db import plant_db
+import plant_data_store
+from plant_data_store import create_plant_data_store
+
+DAY = 86400
+# Inicio de un mes (2024-03-01 UTC), para que las lecturas caigan en dos meses
+START = 1709251200
+
+
+@pytest.fixture
+def store():
+    collection_name = 'test_archive_plant_data'
+    store = create_plant_data_store(plant_db, 'flat')
+    store.collection = plant_db[collection_name]
+    yield store
+    plant_db.drop_collection(collection_name)
+
+
+def readings(count, step=60):
+    # Dos lecturas por timestamp del mismo sensor: no se deben juntar al archivar
+    return [{'plant_id': 'plant001', 'timestamp': START + index // 2 * step, 'sensor_num': '0', 'temperature': index}
+            for index in range(count)]
+
+
+def rows(documents):
+    return [(doc['_id'], doc['timestamp'], doc['temperature']) for doc in documents]
+
+
+@pytest.mark.parametrize('batch_size', [10000, 7])
+def test_archive_keeps_every_reading(store, tmp_path, batch_size):
+    store.insert_many(readings(1441, step=DAY * 40 // 1441))
+    before = rows(store.find('plant001'))
+    archive = ColdArchive(str(tmp_path), batch_size=batch_size)
+
+    totals = archive.archive(store, START + 40 * DAY)
+
+    assert totals['archived'] == 1441
+    assert totals['deleted'] == 1441
+    assert store.count() == 0
+    assert rows(TieredPlantData(store, archive).find('plant001')) == before
+    assert archive.stats()['readings'] == 1441
+
+
+def test_archive_rerun_does_not_duplicate(store, tmp_path):
+    store.insert_many(readings(100))
+    before = rows(store.find('plant001'))
+    archive = ColdArchive(str(tmp_path), batch_size=30)
+    delete_readings = store.delete_readings
+    store.delete_readings = lambda plant_id, docs: 1 / 0
+    archive.archive(store, START + DAY)
+    store.delete_readings = delete_readings
+
+    assert rows(TieredPlantData(store, archive).find('plant001')) == before
+    totals = archive.archive(store, START + DAY)
+
+    assert totals == {'archived': 0, 'deleted': 100, 'plants': 1}
+    assert rows(TieredPlantData(store, archive).find('plant001')) == before
+    assert archive.stats()['readings'] == 100
+
+
+def test_delete_plant_waits_for_archive_lock(store, tmp_path):
+    store.insert_many(readings(10))
+    archive = ColdArchive(str(tmp_path))
+    archive.archive(store, START + DAY)
+    other_process = ColdArchive(str(tmp_path))
+
+    deleted = []
+    with archive._locked():
+        # flock es por descriptor de archivo, asi que otro hilo tambien espera como otro proceso
+        thread = threading.Thread(target=lambda: deleted.append(other_process.delete_plant('plant001')))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join()
+
+    assert deleted == [10]
+    assert archive.archived_before('plant001') is None
+
+
+@pytest.mark.parametrize('version, supported', [(5, False), (6, False), (7, True)])
+def test_timeseries_archive_needs_mongodb_7(tmp_path, monkeypatch, version, supported):
+    monkeypatch.setattr(plant_data_store, 'server_major_version', lambda db: version)
+    store = plant_data_store.TimeSeriesPlantDataStore(plant_db)
+    assert store.can_delete_readings() is supported
+    if not supported:
+        with pytest.raises(RuntimeError, match='MongoDB 7.0'):
+            ColdArchive(str(tmp_path)).archive(store, START + DAY)
+        assert not os.listdir(tmp_path)
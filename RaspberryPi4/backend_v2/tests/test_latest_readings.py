@@ -0,0 +1,32 @@
+import pytest
+
+from db import plant_db
+from latest_readings import LatestReadings
+from plant_data_store import create_plant_data_store
+
+
+@pytest.fixture
+def store():
+    collection_name = 'test_latest_plant_data'
+    store = create_plant_data_store(plant_db, 'flat')
+    store.collection = plant_db[collection_name]
+    yield store
+    plant_db.drop_collection(collection_name)
+
+
+def test_refresh_loads_only_newest_reading_per_sensor(store, monkeypatch):
+    latest = LatestReadings(store, refresh_seconds=1)
+    latest.seed()
+    # Lecturas que este worker no vio (las inserto otro proceso)
+    store.collection.insert_many([{'plant_id': 'plant001', 'timestamp': 2000000000 + index, 'sensor_num': str(index % 2), 'temperature': index}
+                                  for index in range(500)])
+    store.collection.insert_one({'plant_id': 'plant002', 'timestamp': 2000001000, 'sensor_num': '0', 'temperature': 1})
+    monkeypatch.setattr(store, 'find', lambda *args, **kwargs: pytest.fail('refresh must not read the history'))
+    recorded = []
+    record = latest.record
+    monkeypatch.setattr(latest, 'record', lambda documents: recorded.append(len(documents)) or record(documents))
+
+    readings = latest.get('plant001')
+
+    assert recorded == [2]
+    assert sorted((doc['sensor_num'], doc['temperature']) for doc in readings) == [('0', 498), ('1', 499)]
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+
+def reading(plant_id, **extra):
+    return {'plant_id': plant_id, 'sensor_num': '0', 'temp': '23.50', 'rel_hum': '96.10', 'lux': '1034', 'moi_ana': '432', **extra}
+
+
+@pytest.mark.parametrize('timestamp', [None, 0, -5, '1756173494', True, 10**20, 2**63, 1.5])
+def test_batch_rejects_invalid_timestamp(client, timestamp):
+    plant_id = 'tsbatch0'
+    response = client.post('/plant_data/batch', json=[reading(plant_id, timestamp=timestamp), reading(plant_id, timestamp=1756173494)])
+
+    assert response.status_code == 207
+    assert response.json['inserted'] == 1
+    assert [error['index'] for error in response.json['errors']] == [0]
+
+    stream = client.get(f'/plant_data/{plant_id}?stream=1')
+    assert stream.status_code == 200
+    assert [json.loads(line)['timestamp'] for line in stream.get_data(as_text=True).splitlines()] == [1756173494]
+    client.delete('/plant_data', json={'plant_id': plant_id})
+
+
+@pytest.mark.parametrize('limit', ['-5', '0', 'abc'])
+def test_plant_data_rejects_invalid_limit(client, limit):
+    plant_id = 'limit000'
+    client.post('/plant_data/batch', json=[reading(plant_id, timestamp=1756173494)])
+
+    assert client.get(f'/plant_data/{plant_id}?limit={limit}').status_code == 400
+    assert client.get(f'/plant_data/{plant_id}?stream=1&limit={limit}').status_code == 400
+    assert client.get(f'/plant_data/missing0?limit={limit}').status_code == 400
+    client.delete('/plant_data', json={'plant_id': plant_id})
+
+
+@pytest.mark.parametrize('value', ['inf', '-inf', 'nan', '1e400', '99999999999999999999', '-5', 'not-a-date'])
+def test_invalid_from_returns_400(client, value):
+    assert client.get(f'/plant_data/limit000?from={value}').status_code == 400
+    assert client.get(f'/plant_data/limit000?stream=1&from={value}').status_code == 400
+    assert client.get(f'/plant_data/limit000/rollup?from={value}').status_code == 400
+    assert client.get(f'/plant_data/export?from={value}').status_code == 400
+
+
+def test_iso_dates_without_timezone_are_utc():
+    from readings import parse_timestamp
+
+    assert parse_timestamp('2025-08-26T01:58:14') == 1756173494
+    assert parse_timestamp('2025-08-25T20:58:14-05:00') == 1756173494
+    assert parse_timestamp('1756173494.9') == 1756173494
@@ -0,0 +1,43 @@
+import pytest
+
+import app as cultivapp
+
+
+@pytest.fixture
+def scheduler(flask_app):
+    cultivapp.scheduler.start(paused=True)
+    yield cultivapp.scheduler
+    cultivapp.scheduler.shutdown(wait=False)
+
+
+def test_sync_poll_jobs_keeps_internal_jobs(scheduler):
+    scheduler.add_job(id=cultivapp.SYNC_JOB_ID, func=cultivapp.sync_poll_jobs, trigger='interval', seconds=30)
+    scheduler.add_job(id=cultivapp.ARCHIVE_JOB_ID, func=cultivapp.archive_old_readings, trigger='interval', seconds=3600)
+    # Job de una planta que ya no existe en plant_collection
+    scheduler.add_job(id='deleted0', func=cultivapp.archive_old_readings, trigger='interval', seconds=60)
+
+    cultivapp.sync_poll_jobs()
+
+    job_ids = {job.id for job in scheduler.get_jobs()}
+    assert job_ids == {cultivapp.SYNC_JOB_ID, cultivapp.ARCHIVE_JOB_ID}
+
+
+@pytest.mark.parametrize('interval', [0, -30, None])
+def test_load_request_jobs_skips_invalid_interval(scheduler, monkeypatch, interval):
+    monkeypatch.setattr(cultivapp.device_registry, 'get_many', lambda macs: {mac: {'latest_ip': '10.0.0.9'} for mac in macs})
+    monkeypatch.setattr(cultivapp, 'curl_ping_device', lambda device_ip: True)
+    plants = [
+        {'plant_id': 'poll0000', 'plant_name': 'a', 'device_mac': 'AA:BB', 'soil_sens_num': 0, 'plant_update_poll': interval},
+        {'plant_id': 'poll0001', 'plant_name': 'b', 'device_mac': 'AA:BB', 'soil_sens_num': 1, 'plant_update_poll': 60},
+    ]
+
+    cultivapp.load_request_jobs(plants)
+
+    assert {job.id for job in scheduler.get_jobs()} == {'poll0001'}
+
+
+def test_plant_registration_rejects_zero_interval(client):
+    plant = {'plant_name': 'tomate', 'plant_type': 'cherry', 'plant_date': 1756173494,
+             'plant_update_poll': 0, 'device_mac': 'AA:BB', 'soil_sens_num': 0}
+
+    assert client.post('/plant', json=plant).status_code == 406
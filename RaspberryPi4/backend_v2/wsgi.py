@@ -0,0 +1,7 @@
+"""Punto de entrada WSGI para produccion.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()
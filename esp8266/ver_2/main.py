@@ -128,7 +128,7 @@ def setup_socket():
 
 
 
-def get_sensor_data(mux_select):
+def read_ambient_sensors():
     data = dict()
 
     # [TODO]: Add better handling of errors if a sensor disconnects after boot and implement a health_check call
@@ -147,21 +147,37 @@ def get_sensor_data(mux_select):
     else:
         data['temp'] = "N/A"
         data['rel_hum'] = "N/A"
+    return data
 
+def read_soil_sensor(mux_select):
     args = list("{0:03b}".format(mux_select)) # Convert sensor number to binary in order to set sensor input of multiplexer
     setMultiplexerPins(int(args[2]), int(args[1]), int(args[0]))
-    sensorAnalog = adc.read()
+    return adc.read()
+
+def get_sensor_data(mux_select):
+    data = read_ambient_sensors()
+    sensorAnalog = read_soil_sensor(mux_select)
 
     #print("\nSensor Number: {}".format(mux_select))
-    #print("Temperature: {:.2f} C".format(temp))
-    #print("Humidity: {:.2f}".format(rel_hum))
-    #print("Luminance: {:.2f} lux".format(lux))
     #print("Soil Moisture ADC Value: {:.2f}".format(sensorAnalog))
     
     data['sensor_num'] = str(mux_select)
     data['moi_ana'] = str("{:.2f}".format(sensorAnalog))
     return data
 
+def get_multi_sensor_data(sensors):
+    # AHT10 and BH1750 are read once and shared by every soil sensor in the request
+    ambient = read_ambient_sensors()
+    readings = []
+    for sensor in sensors[:MAX_HUM_SENSORS]:
+        mux_select = int(sensor['sensor_num'])
+        data = dict(ambient)
+        data['plant_id'] = sensor['plant_id']
+        data['sensor_num'] = str(mux_select)
+        data['moi_ana'] = str("{:.2f}".format(read_soil_sensor(mux_select)))
+        readings.append(data)
+    return readings
+
 def handle_request(client_socket):
     try:
         request = client_socket.recv(1024).decode()
@@ -173,7 +189,15 @@ def handle_request(client_socket):
             json_payload_bytes = request
         # Simple routing based on URL path
         # print(f"Payload Bytes: {len(json_payload_bytes)}\n")
-        if 'POST /data' in request:
+        # /data_multi must be checked before /data, 'POST /data' is also a prefix of it
+        if 'POST /data_multi' in request:
+            json_data_recieved = json.loads(json_payload_bytes)
+            readings_to_send = get_multi_sensor_data(json_data_recieved['sensors'])
+
+            print(f'[ OK ] Sending {len(readings_to_send)} readings to server')
+            response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nSent to db'.encode('utf-8')
+            requests.post(url=f'{server_url}/plant_data/batch', json = readings_to_send, headers = {'Content-Type': 'application/json'})
+        elif 'POST /data' in request:
             json_data_recieved = json.loads(json_payload_bytes)
             # print(json_data_recieved)
             data_to_send = get_sensor_data(int(json_data_recieved['sensor_num']))